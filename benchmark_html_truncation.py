@@ -0,0 +1,98 @@
+"""Compare full HTML-to-text conversion with html_text_prefix on raw ATS payloads."""
+import argparse
+import bz2
+import json
+import random
+import statistics
+import time
+
+from utils.html_truncate import html_text_prefix
+from utils.html_utils import remove_html_markup
+
+
+ATS_TYPES = ["greenhouse", "lever", "ashby"]
+SAMPLE_SIZE = 2000
+LIMITS = [2000, 3000]
+# HTML length bands reported separately, so a slowdown on mid-sized postings isn't
+# averaged away by the big wins on huge ones.
+SIZE_BANDS = [0, 12_000, 36_000, 100_000]
+
+
+def load_descriptions(ats: str, limit: int, largest: bool = False, seed: int = 0) -> list[str]:
+    """A seeded random sample of description HTML from data/raw/<ats>.jsonl.bz2, or the largest payloads."""
+    path = f"data/raw/{ats}.jsonl.bz2"
+    descriptions = []
+    try:
+        with bz2.open(path, "rt") as f:
+            for line in f:
+                raw = json.loads(line)
+                # Same field precedence as load_to_meili.build_doc.
+                html = raw.get("content", "") or raw.get("description", "") or raw.get("descriptionHtml", "") or ""
+                if html:
+                    descriptions.append(html)
+    except FileNotFoundError:
+        print(f"Skipping {path} (not found)")
+    if largest:
+        descriptions.sort(key=len, reverse=True)
+        return descriptions[:limit]
+    return random.Random(seed).sample(descriptions, min(limit, len(descriptions)))
+
+
+def timed(fn, items: list[str]) -> tuple[list[str], float]:
+    started = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, time.perf_counter() - started
+
+
+def compare(descriptions: list[str], limit: int) -> dict:
+    full, full_s = timed(lambda html: remove_html_markup(html, double_unescape=True)[:limit], descriptions)
+    prefix, prefix_s = timed(lambda html: html_text_prefix(html, limit, double_unescape=True), descriptions)
+    return {
+        "documents": len(descriptions),
+        "full_s": round(full_s, 3),
+        "prefix_s": round(prefix_s, 3),
+        "speedup": round(full_s / prefix_s, 2) if prefix_s else None,
+        "mismatches": sum(1 for a, b in zip(full, prefix) if a != b),
+    }
+
+
+def benchmark(ats: str, descriptions: list[str], limit: int) -> dict:
+    sizes = [len(html) for html in descriptions]
+    bands = {}
+    for low, high in zip(SIZE_BANDS, [*SIZE_BANDS[1:], None]):
+        band = [html for html in descriptions if len(html) >= low and (high is None or len(html) < high)]
+        if band:
+            bands[f"{low}-{high or ''}"] = compare(band, limit)
+    return {
+        "ats": ats,
+        "limit": limit,
+        "median_html_chars": int(statistics.median(sizes)),
+        "max_html_chars": max(sizes),
+        **compare(descriptions, limit),
+        "bands": bands,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ats", nargs="+", default=ATS_TYPES)
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="Descriptions sampled per ATS")
+    parser.add_argument("--largest", action="store_true", help="Take the largest descriptions instead of a random sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limits", type=int, nargs="+", default=LIMITS)
+    args = parser.parse_args()
+
+    results = []
+    for ats in args.ats:
+        descriptions = load_descriptions(ats, args.sample_size, largest=args.largest, seed=args.seed)
+        if not descriptions:
+            continue
+        for limit in args.limits:
+            results.append(benchmark(ats, descriptions, limit))
+            print(json.dumps(results[-1]), flush=True)
+    print(json.dumps(results, indent=2))
+    return 1 if any(result["mismatches"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
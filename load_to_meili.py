@@ -1,11 +1,36 @@
 """Load parsed job data into MeiliSearch."""
 import argparse
-import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+
 import meilisearch
+from meilisearch.errors import MeilisearchApiError
+from ops.meili_settings import MeiliSettings
+from utils.html_truncate import html_text_prefix
 from utils.html_utils import remove_html_markup
+from utils.jsonl import dumps, iter_jsonl, iter_lines, loads
 
 MEILI_HOST = "http://localhost:7700"
 INDEX_NAME = "jobs"
+STREAM_BATCH_SIZE = 5000
+STREAM_MAX_IN_FLIGHT = 4
+RAW_INDEX_COMMIT_EVERY = 50_000
+TASK_TIMEOUT_MS = 30 * 60 * 1000
+DESCRIPTION_MAX_CHARS = 3000
+# html_text_prefix is a heuristic; keep the exact conversion unless --prefix-html asks for it.
+PREFIX_HTML_DESCRIPTIONS = False
+# --blue-green builds here, then swaps it with INDEX_NAME; afterwards it holds the previous index.
+STAGING_INDEX_NAME = f"{INDEX_NAME}_next"
+# Refuse to swap in a rebuild that lost more than this share of the live index's documents.
+BLUE_GREEN_MAX_SHRINK = 0.1
+# GET /settings masks embedder API keys, so --blue-green takes the real one from here.
+EMBEDDER_API_KEY_ENV = "MEILI_EMBEDDER_API_KEY"
 
 
 def build_doc(record: dict, raw: dict) -> dict:
@@ -38,8 +63,10 @@ def build_doc(record: dict, raw: dict) -> dict:
         or raw.get("descriptionHtml", "")
         or ""
     )
-    if description:
-        description = remove_html_markup(description, double_unescape=True)
+    if description and PREFIX_HTML_DESCRIPTIONS:
+        description = html_text_prefix(description, DESCRIPTION_MAX_CHARS, double_unescape=True)
+    elif description:
+        description = remove_html_markup(description, double_unescape=True)[:DESCRIPTION_MAX_CHARS]
 
     # Company
     board = raw.get("board_token", "")
@@ -64,7 +91,7 @@ def build_doc(record: dict, raw: dict) -> dict:
         "tagline": m.get("tagline", ""),
         "company": company,
         "company_slug": board,
-        "description": description[:3000],
+        "description": description,
         "url": raw.get("absolute_url", raw.get("url", raw.get("hostedUrl", ""))),
         "location": location_str,
         "_geo": geo,
@@ -92,59 +119,511 @@ def build_doc(record: dict, raw: dict) -> dict:
     }
 
 
-def load(parsed_path: str, raw_path: str, clear: bool = False):
+# Declarative: configure_index() only sends what differs from the live index.
+INDEX_SETTINGS = {
+    "filterableAttributes": [
+        "office_type", "job_type", "experience_level", "is_manager",
+        "industry", "company_slug", "ats_type",
+        "cool_factor", "vibe_tags", "visa_sponsorship", "equity_offered",
+        "company_stage", "benefits_categories", "salary_transparency",
+    ],
+    "searchableAttributes": [
+        "title", "tagline", "company", "description", "location",
+        "hard_skills", "soft_skills", "benefits_highlights",
+    ],
+    "sortableAttributes": [
+        "salary_min", "salary_max",
+    ],
+}
+
+
+def configure_index(index_uid: str = INDEX_NAME, dry_run: bool = False) -> dict:
+    """Bring the index settings in line with INDEX_SETTINGS, skipping the task if nothing changed."""
+    return MeiliSettings(MEILI_HOST, index_uid).apply(INDEX_SETTINGS, dry_run=dry_run)
+
+
+def load(parsed_path: str, raw_path: str, clear: bool = False, index_uid: str = INDEX_NAME) -> int:
     # Load raw jobs for enrichment
     raw_lookup = {}
-    with open(raw_path) as f:
-        for line in f:
-            job = json.loads(line)
-            raw_lookup[job.get("id", job.get("absolute_url", ""))] = job
+    for job in iter_jsonl(raw_path):
+        raw_lookup[job.get("id", job.get("absolute_url", ""))] = job
 
     # Build documents
     docs = []
-    with open(parsed_path) as f:
-        for line in f:
-            record = json.loads(line)
-            raw = raw_lookup.get(record["id"], {})
-            docs.append(build_doc(record, raw))
+    for record in iter_jsonl(parsed_path):
+        raw = raw_lookup.get(record["id"], {})
+        docs.append(build_doc(record, raw))
 
     print(f"Prepared {len(docs)} documents")
 
     # Index
     client = meilisearch.Client(MEILI_HOST)
-    index = client.index(INDEX_NAME)
+    index = client.index(index_uid)
 
     if clear:
         task = index.delete_all_documents()
-        client.wait_for_task(task.task_uid)
+        wait_for_indexing(client, task.task_uid)
         print("Cleared existing documents")
 
-    index.update_filterable_attributes([
-        "office_type", "job_type", "experience_level", "is_manager",
-        "industry", "company_slug", "ats_type",
-        "cool_factor", "vibe_tags", "visa_sponsorship", "equity_offered",
-        "company_stage", "benefits_categories", "salary_transparency",
-    ])
-    index.update_searchable_attributes([
-        "title", "tagline", "company", "description", "location",
-        "hard_skills", "soft_skills", "benefits_highlights",
-    ])
-    index.update_sortable_attributes([
-        "salary_min", "salary_max",
-    ])
+    configure_index(index_uid)
 
     task = index.add_documents(docs, primary_key="id")
     print(f"Indexing... task uid: {task.task_uid}")
-    client.wait_for_task(task.task_uid)
+    wait_for_indexing(client, task.task_uid)
 
     stats = index.get_stats()
     print(f"Done! {stats.number_of_documents} documents in index")
+    return len(docs)
+
+
+def raw_source_fingerprint(raw_path: str) -> tuple[str, int, int]:
+    stat = os.stat(raw_path)
+    return os.path.abspath(raw_path), stat.st_size, stat.st_mtime_ns
+
+
+def open_raw_index(index_path: str, fingerprint: tuple[str, int, int]) -> sqlite3.Connection | None:
+    """Open a finished raw index built from the same source file, or None."""
+    if not os.path.exists(index_path):
+        return None
+    try:
+        db = sqlite3.connect(index_path)
+        row = db.execute("SELECT source, size, mtime_ns, complete FROM raw_index_meta").fetchone()
+    except sqlite3.DatabaseError:
+        # Missing meta table (older or interrupted build) or a file damaged mid-write.
+        return None
+    if row is None or tuple(row[:3]) != fingerprint or row[3] != 1:
+        db.close()
+        return None
+    return db
+
+
+def build_raw_index(raw_path: str, index_path: str) -> sqlite3.Connection:
+    """Write raw jobs to an on-disk SQLite table keyed like the in-memory lookup.
+
+    An existing index is reused only if it was finished and built from the same
+    raw file (path, size and mtime); anything else is rebuilt from scratch.
+    """
+    fingerprint = raw_source_fingerprint(raw_path)
+    db = open_raw_index(index_path, fingerprint)
+    if db is not None:
+        print(f"Reusing raw index {index_path}")
+        return db
+    for path in (index_path, f"{index_path}-journal", f"{index_path}-wal", f"{index_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    db = sqlite3.connect(index_path)
+    # Unjournaled for speed: an interrupted build has no complete meta row and is rebuilt.
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    # No declared type on id: ints and strings stay distinct, same as dict keys.
+    db.execute("CREATE TABLE raw_jobs (id PRIMARY KEY, line BLOB NOT NULL)")
+    db.execute(
+        "CREATE TABLE raw_index_meta (source TEXT NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, complete INTEGER NOT NULL)"
+    )
+
+    rows = []
+    count = 0
+    for line in iter_lines(raw_path):
+        job = loads(line)
+        rows.append((job.get("id", job.get("absolute_url", "")), line))
+        if len(rows) >= RAW_INDEX_COMMIT_EVERY:
+            db.executemany("INSERT OR REPLACE INTO raw_jobs (id, line) VALUES (?, ?)", rows)
+            db.commit()
+            count += len(rows)
+            rows.clear()
+    if rows:
+        db.executemany("INSERT OR REPLACE INTO raw_jobs (id, line) VALUES (?, ?)", rows)
+        count += len(rows)
+    db.execute("INSERT INTO raw_index_meta (source, size, mtime_ns, complete) VALUES (?, ?, ?, 1)", fingerprint)
+    db.commit()
+    print(f"Indexed {count} raw jobs into {index_path}")
+    return db
+
+
+def lookup_raw(db: sqlite3.Connection, ids: list) -> dict:
+    found = {}
+    unique_ids = list(dict.fromkeys(ids))
+    # Stay well under SQLite's bound-parameter limit.
+    for start in range(0, len(unique_ids), 900):
+        chunk = unique_ids[start:start + 900]
+        placeholders = ",".join("?" * len(chunk))
+        for job_id, line in db.execute(
+            f"SELECT id, line FROM raw_jobs WHERE id IN ({placeholders})", chunk
+        ):
+            found[job_id] = loads(line)
+    return found
+
+
+def iter_parsed_line_batches(parsed_path: str, batch_size: int) -> Iterator[list[bytes]]:
+    """Undecoded parsed lines in batches; decoding is left to the build workers."""
+    batch = []
+    for line in iter_lines(parsed_path):
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_parsed_batches(parsed_path: str, batch_size: int) -> Iterator[list[dict]]:
+    batch = []
+    for record in iter_jsonl(parsed_path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def wait_for_indexing(client, task_uid: int) -> None:
+    task = client.wait_for_task(task_uid, timeout_in_ms=TASK_TIMEOUT_MS, interval_in_ms=250)
+    if task.status != "succeeded":
+        raise RuntimeError(f"Indexing task {task_uid} {task.status}: {task.error}")
+
+
+def load_stream(
+    parsed_path: str,
+    raw_path: str,
+    clear: bool = False,
+    batch_size: int = STREAM_BATCH_SIZE,
+    max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+    raw_index_path: str | None = None,
+    index_uid: str = INDEX_NAME,
+) -> int:
+    """Constant-memory variant of load(): bounded batches, raw join via SQLite."""
+    client = meilisearch.Client(MEILI_HOST)
+    index = client.index(index_uid)
+
+    if clear:
+        task = index.delete_all_documents()
+        wait_for_indexing(client, task.task_uid)
+        print("Cleared existing documents")
+
+    configure_index(index_uid)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = build_raw_index(raw_path, raw_index_path or os.path.join(tmp_dir, "raw.sqlite"))
+        try:
+            in_flight: deque[int] = deque()
+            total = 0
+            for batch_num, records in enumerate(iter_parsed_batches(parsed_path, batch_size), start=1):
+                raw_lookup = lookup_raw(db, [record["id"] for record in records])
+                docs = [build_doc(record, raw_lookup.get(record["id"], {})) for record in records]
+                task = index.add_documents(docs, primary_key="id")
+                in_flight.append(task.task_uid)
+                total += len(docs)
+                print(f"Batch {batch_num}: {len(docs)} documents, task uid {task.task_uid}, {total} sent")
+
+                # Let earlier batches index while we build the next ones, but bound the backlog.
+                while len(in_flight) >= max_in_flight:
+                    wait_for_indexing(client, in_flight.popleft())
+
+            while in_flight:
+                wait_for_indexing(client, in_flight.popleft())
+        finally:
+            db.close()
+
+    print(f"Sent {total} documents")
+    stats = index.get_stats()
+    print(f"Done! {stats.number_of_documents} documents in index")
+    return total
+
+
+# Per-process state for --workers document builders; each keeps its own read-only raw index handle.
+_worker_db: sqlite3.Connection | None = None
+
+
+def init_build_worker(raw_index_path: str, prefix_html: bool = False) -> None:
+    global _worker_db, PREFIX_HTML_DESCRIPTIONS
+    # Spawned workers don't inherit the CLI's setting.
+    PREFIX_HTML_DESCRIPTIONS = prefix_html
+    # as_uri() percent-encodes the path, so "?", "#" or "%" in it can't be read as URI syntax.
+    _worker_db = sqlite3.connect(f"{Path(raw_index_path).absolute().as_uri()}?mode=ro", uri=True)
+
+
+def build_batch(lines: list[bytes]) -> tuple[int, str]:
+    """Decode, join and build one batch, returned as a serialized JSON array."""
+    records = [loads(line) for line in lines]
+    raw_lookup = lookup_raw(_worker_db, [record["id"] for record in records])
+    docs = [build_doc(record, raw_lookup.get(record["id"], {})) for record in records]
+    return len(docs), dumps(docs).decode()
+
+
+def load_parallel(
+    parsed_path: str,
+    raw_path: str,
+    clear: bool = False,
+    batch_size: int = STREAM_BATCH_SIZE,
+    max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+    raw_index_path: str | None = None,
+    index_uid: str = INDEX_NAME,
+    workers: int = 2,
+    ordered: bool = False,
+) -> int:
+    """load_stream() with batches built in ``workers`` processes and uploaded from here.
+
+    At most ``2 * workers`` batches are read ahead of the uploader, so memory stays
+    bounded when Meilisearch is the bottleneck. Batches are sent as they finish
+    unless ``ordered`` is set.
+    """
+    client = meilisearch.Client(MEILI_HOST)
+    index = client.index(index_uid)
+
+    if clear:
+        task = index.delete_all_documents()
+        wait_for_indexing(client, task.task_uid)
+        print("Cleared existing documents")
+
+    configure_index(index_uid)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = raw_index_path or os.path.join(tmp_dir, "raw.sqlite")
+        build_raw_index(raw_path, index_path).close()
+
+        slots = threading.Semaphore(2 * workers)
+        stop = threading.Event()
+
+        def feed() -> Iterator[list[bytes]]:
+            # Runs on the pool's task-feeding thread; blocks once enough batches are out.
+            for lines in iter_parsed_line_batches(parsed_path, batch_size):
+                slots.acquire()
+                if stop.is_set():
+                    return
+                yield lines
+
+        pool = multiprocessing.Pool(
+            processes=workers,
+            initializer=init_build_worker,
+            initargs=(index_path, PREFIX_HTML_DESCRIPTIONS),
+        )
+        try:
+            results = (pool.imap if ordered else pool.imap_unordered)(build_batch, feed(), chunksize=1)
+            in_flight: deque[int] = deque()
+            total = 0
+            for batch_num, (count, payload) in enumerate(results, start=1):
+                slots.release()
+                task = index.add_documents_json(payload, primary_key="id")
+                in_flight.append(task.task_uid)
+                total += count
+                print(f"Batch {batch_num}: {count} documents, task uid {task.task_uid}, {total} sent")
+
+                while len(in_flight) >= max_in_flight:
+                    wait_for_indexing(client, in_flight.popleft())
+
+            while in_flight:
+                wait_for_indexing(client, in_flight.popleft())
+            pool.close()
+            pool.join()
+        finally:
+            # Unblock the feeder so terminate() can join it.
+            stop.set()
+            slots.release()
+            pool.terminate()
+
+    print(f"Sent {total} documents")
+    stats = index.get_stats()
+    print(f"Done! {stats.number_of_documents} documents in index")
+    return total
+
+
+def index_exists(client, index_uid: str) -> bool:
+    try:
+        client.get_raw_index(index_uid)
+    except MeilisearchApiError as exc:
+        if getattr(exc, "code", None) == "index_not_found":
+            return False
+        raise
+    return True
+
+
+def index_stats(client, index_uid: str) -> dict:
+    # Raw stats: the embedding counts aren't on the client's IndexStats object.
+    return client.http.get(f"indexes/{index_uid}/stats")
+
+
+def _set_api_keys(config, api_key: str, path: str = "") -> list[str]:
+    """Replace every ``apiKey`` in an embedder config, nested ones included; return where they were."""
+    found = []
+    if isinstance(config, dict):
+        if "apiKey" in config:
+            found.append(f"{path}.apiKey" if path else "apiKey")
+            if api_key:
+                config["apiKey"] = api_key
+            else:
+                del config["apiKey"]
+        for key, value in config.items():
+            found.extend(_set_api_keys(value, api_key, f"{path}.{key}" if path else key))
+    return found
+
+
+def prepare_staging_index(client) -> None:
+    """Recreate STAGING_INDEX_NAME empty, with the live index's settings and embedders."""
+    live_settings = MeiliSettings(MEILI_HOST, INDEX_NAME).fetch()
+    api_key = os.environ.get(EMBEDDER_API_KEY_ENV, "")
+    for name, embedder in (live_settings.get("embedders") or {}).items():
+        # GET masks API keys (composite embedders nest them); copying the mask would break staging.
+        keyed = _set_api_keys(embedder, api_key)
+        if keyed and not api_key:
+            raise RuntimeError(
+                f"Embedder {name} needs an API key ({', '.join(keyed)}); "
+                f"set {EMBEDDER_API_KEY_ENV} to rebuild into {STAGING_INDEX_NAME}"
+            )
+
+    if index_exists(client, STAGING_INDEX_NAME):
+        wait_for_indexing(client, client.delete_index(STAGING_INDEX_NAME).task_uid)
+        print(f"Deleted previous {STAGING_INDEX_NAME}")
+    for index_uid in (INDEX_NAME, STAGING_INDEX_NAME):
+        if not index_exists(client, index_uid):
+            # The swap needs both sides to exist.
+            wait_for_indexing(client, client.create_index(index_uid, {"primaryKey": "id"}).task_uid)
+
+    # Settings go on before any document so embeddings are computed once, while indexing.
+    MeiliSettings(MEILI_HOST, STAGING_INDEX_NAME).apply(live_settings)
+
+
+def verify_staging_index(client, expected_docs: int, max_shrink: float = BLUE_GREEN_MAX_SHRINK) -> dict:
+    """Check the staging index is complete enough to serve; raise instead of swapping."""
+    staging = index_stats(client, STAGING_INDEX_NAME)
+    live_docs = index_stats(client, INDEX_NAME)["numberOfDocuments"]
+    docs = staging["numberOfDocuments"]
+    print(f"{STAGING_INDEX_NAME}: {staging}")
+    if docs != expected_docs:
+        raise RuntimeError(f"{STAGING_INDEX_NAME} has {docs} documents, {expected_docs} distinct ids were loaded")
+    if live_docs and docs < live_docs * (1 - max_shrink):
+        raise RuntimeError(
+            f"{STAGING_INDEX_NAME} has {docs} documents, {INDEX_NAME} has {live_docs}; "
+            f"refusing to swap (max shrink {max_shrink:.0%})"
+        )
+    # Only reported by Meilisearch versions that track embeddings in index stats.
+    embedded = staging.get("numberOfEmbeddedDocuments")
+    has_embedders = bool(MeiliSettings(MEILI_HOST, STAGING_INDEX_NAME).fetch().get("embedders"))
+    if has_embedders and embedded is not None and embedded != docs:
+        raise RuntimeError(f"{STAGING_INDEX_NAME} has embeddings for {embedded} of {docs} documents")
+    return staging
+
+
+def swap_indexes(client) -> None:
+    task = client.swap_indexes([{"indexes": [INDEX_NAME, STAGING_INDEX_NAME]}])
+    wait_for_indexing(client, task.task_uid)
+    print(f"Swapped {INDEX_NAME} and {STAGING_INDEX_NAME}")
+
+
+def count_distinct_ids(parsed_path: str) -> int:
+    """Distinct document ids in a parsed file, the count the index should hold after loading it.
+
+    Ids go through a temporary on-disk SQLite table, so memory stays flat however
+    large the file is.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = sqlite3.connect(os.path.join(tmp_dir, "ids.sqlite"))
+        try:
+            db.execute("PRAGMA journal_mode = OFF")
+            db.execute("PRAGMA synchronous = OFF")
+            # No declared type, so ids compare the way Meilisearch primary keys are kept apart.
+            db.execute("CREATE TABLE ids (id PRIMARY KEY)")
+            for lines in iter_parsed_line_batches(parsed_path, STREAM_BATCH_SIZE):
+                db.executemany("INSERT OR IGNORE INTO ids (id) VALUES (?)", [(loads(line)["id"],) for line in lines])
+            return db.execute("SELECT count(*) FROM ids").fetchone()[0]
+        finally:
+            db.close()
+
+
+def load_blue_green(load_fn, parsed_path: str, *args, max_shrink: float = BLUE_GREEN_MAX_SHRINK, **kwargs) -> None:
+    """Full rebuild into STAGING_INDEX_NAME, verified, then atomically swapped live.
+
+    Search keeps serving the old documents until the swap. The old index stays
+    behind as STAGING_INDEX_NAME until the next rebuild; ``--rollback`` swaps it back.
+    """
+    client = meilisearch.Client(MEILI_HOST)
+    prepare_staging_index(client)
+    load_fn(parsed_path, *args, clear=False, index_uid=STAGING_INDEX_NAME, **kwargs)
+    # Counted only here: the loaders stream, and duplicate ids in the input collapse in the index.
+    verify_staging_index(client, count_distinct_ids(parsed_path), max_shrink)
+    swap_indexes(client)
+
+
+def rollback_blue_green() -> None:
+    client = meilisearch.Client(MEILI_HOST)
+    if not index_exists(client, STAGING_INDEX_NAME):
+        raise SystemExit(f"No {STAGING_INDEX_NAME} index to roll back to")
+    swap_indexes(client)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("parsed", help="Parsed JSONL file")
-    parser.add_argument("raw", help="Raw scraped JSONL file")
+    parser.add_argument("parsed", nargs="?", help="Parsed JSONL file")
+    parser.add_argument("raw", nargs="?", help="Raw scraped JSONL file")
     parser.add_argument("--clear", action="store_true", help="Clear index first")
+    parser.add_argument(
+        "--blue-green", action="store_true",
+        help=f"Rebuild into {STAGING_INDEX_NAME}, verify it, then swap it with {INDEX_NAME}",
+    )
+    parser.add_argument(
+        "--max-shrink", type=float, default=BLUE_GREEN_MAX_SHRINK,
+        help="Largest share of the live document count a --blue-green rebuild may lose",
+    )
+    parser.add_argument(
+        "--rollback", action="store_true",
+        help=f"Swap {INDEX_NAME} back with the previous index kept as {STAGING_INDEX_NAME}",
+    )
+    parser.add_argument("--stream", action="store_true", help="Load in bounded batches with constant memory")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE, help="Documents per batch (--stream)")
+    parser.add_argument(
+        "--max-in-flight", type=int, default=STREAM_MAX_IN_FLIGHT,
+        help="Indexing tasks allowed to queue before waiting (--stream)",
+    )
+    parser.add_argument("--raw-index", help="Persist/reuse the on-disk raw join index at this path (--stream)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Build documents in this many processes (--stream); 1 builds in-process",
+    )
+    parser.add_argument(
+        "--ordered", action="store_true",
+        help="Upload batches in input order (--workers); default uploads as they finish",
+    )
+    parser.add_argument(
+        "--settings-dry-run", action="store_true",
+        help="Print the index settings changes a load would make, then exit without loading",
+    )
+    parser.add_argument(
+        "--prefix-html", action="store_true",
+        help="Convert only a prefix of long description HTML (faster; check benchmark_html_truncation.py first)",
+    )
     args = parser.parse_args()
-    load(args.parsed, args.raw, args.clear)
+    PREFIX_HTML_DESCRIPTIONS = args.prefix_html
+    if args.rollback:
+        rollback_blue_green()
+        raise SystemExit(0)
+    if args.settings_dry_run:
+        configure_index(dry_run=True)
+        raise SystemExit(0)
+    if not args.parsed or not args.raw:
+        parser.error("parsed and raw are required")
+    if args.blue_green and args.clear:
+        parser.error("--clear does nothing with --blue-green; the staging index is always rebuilt empty")
+
+    if args.stream and args.workers > 1:
+        load_fn, load_kwargs = load_parallel, {
+            "batch_size": args.batch_size,
+            "max_in_flight": max(1, args.max_in_flight),
+            "raw_index_path": args.raw_index,
+            "workers": args.workers,
+            "ordered": args.ordered,
+        }
+    elif args.stream:
+        load_fn, load_kwargs = load_stream, {
+            "batch_size": args.batch_size,
+            "max_in_flight": max(1, args.max_in_flight),
+            "raw_index_path": args.raw_index,
+        }
+    else:
+        load_fn, load_kwargs = load, {}
+
+    if args.blue_green:
+        load_blue_green(load_fn, args.parsed, args.raw, max_shrink=args.max_shrink, **load_kwargs)
+    else:
+        load_fn(args.parsed, args.raw, args.clear, **load_kwargs)
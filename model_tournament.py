@@ -25,6 +25,7 @@ import requests
 from dotenv import load_dotenv
 
 from legacy_pipeline_bridge import load_pipeline_module
+from utils.jsonl import iter_jsonl, write_jsonl
 
 
 PARSE_MODULE = load_pipeline_module("parse.py")
@@ -171,14 +172,10 @@ def parse_args() -> argparse.Namespace:
 
 def load_eval_items(path: Path, limit: int) -> list[dict[str, Any]]:
     items: list[dict[str, Any]] = []
-    with path.open() as fh:
-        for line in fh:
-            line = line.strip()
-            if not line:
-                continue
-            items.append(json.loads(line))
-    if limit > 0:
-        return items[:limit]
+    for item in iter_jsonl(path):
+        items.append(item)
+        if 0 < limit <= len(items):
+            break
     return items
 
 
@@ -495,12 +492,6 @@ def run_one(
     }
 
 
-def write_jsonl(path: Path, rows: list[dict[str, Any]]) -> None:
-    with path.open("w") as fh:
-        for row in rows:
-            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-
 def render_summary(
     results: list[dict[str, Any]],
     selected_models: list[ModelSpec],
@@ -4,6 +4,7 @@ import sys
 
 import requests
 
+from meili_settings import MeiliSettings
 
 MEILI_HOST = os.environ.get("MEILI_HOST", "http://127.0.0.1:7700").rstrip("/")
 MEILI_KEY = os.environ.get("MEILI_MASTER_KEY", os.environ.get("MEILISEARCH_MASTER_KEY", ""))
@@ -16,8 +17,13 @@ INDEX_EMBEDDER_URL = os.environ.get(
 MODEL_ID = os.environ.get("PPLX_MODEL_ID", "perplexity/pplx-embed-v1-0.6b")
 EMBED_DIM = int(os.environ.get("PPLX_EMBED_DIM", "512"))
 INDEX_UID = os.environ.get("MEILI_INDEX_UID", "jobs")
-RESET_FIRST = os.environ.get("PPLX_RESET_EMBEDDERS_FIRST", "true").lower() not in {"0", "false", "no"}
+# Deleting the embedders forces every document to be re-embedded; only changed
+# embedders are re-sent otherwise.
+RESET_FIRST = os.environ.get("PPLX_RESET_EMBEDDERS_FIRST", "false").lower() not in {"0", "false", "no"}
 ENABLE_COMPOSITE = os.environ.get("PPLX_ENABLE_COMPOSITE", "true").lower() not in {"0", "false", "no"}
+DOCUMENT_TEMPLATE_MAX_BYTES = 8000
+# Irreversible in Meilisearch: measure with ops/measure_quantization_recall.py first.
+BINARY_QUANTIZED = os.environ.get("PPLX_BINARY_QUANTIZED", "false").lower() not in {"0", "false", "no"}
 
 DOCUMENT_TEMPLATE = """
 {% if doc.title %}Job title: {{ doc.title }}.{% endif %}
@@ -29,11 +35,10 @@ DOCUMENT_TEMPLATE = """
 
 
 def main() -> int:
-    headers = {
-        "Content-Type": "application/json",
-        **({"Authorization": f"Bearer {MEILI_KEY}"} if MEILI_KEY else {}),
-    }
-    if ENABLE_COMPOSITE:
+    dry_run = "--dry-run" in sys.argv[1:]
+    settings = MeiliSettings(MEILI_HOST, INDEX_UID, MEILI_KEY)
+    headers = settings.headers
+    if ENABLE_COMPOSITE and not dry_run:
         features = requests.patch(
             f"{MEILI_HOST}/experimental-features",
             headers=headers,
@@ -45,7 +50,7 @@ def main() -> int:
         if not features.ok:
             return 1
 
-    if RESET_FIRST:
+    if RESET_FIRST and not dry_run:
         reset = requests.delete(
             f"{MEILI_HOST}/indexes/{INDEX_UID}/settings/embedders",
             headers=headers,
@@ -55,17 +60,19 @@ def main() -> int:
         print(reset.text)
         if not reset.ok:
             return 1
+        settings.wait_for_task(reset.json()["taskUid"])
 
     body = {
         "default": {
             "source": "composite",
+            **({"binaryQuantized": True} if BINARY_QUANTIZED else {}),
             "indexingEmbedder": {
                 "source": "openAi",
                 "model": MODEL_ID,
                 "url": INDEX_EMBEDDER_URL,
                 "dimensions": EMBED_DIM,
                 "documentTemplate": DOCUMENT_TEMPLATE,
-                "documentTemplateMaxBytes": 8000,
+                "documentTemplateMaxBytes": DOCUMENT_TEMPLATE_MAX_BYTES,
             },
             "searchEmbedder": {
                 "source": "openAi",
@@ -76,15 +83,8 @@ def main() -> int:
         }
     }
 
-    resp = requests.patch(
-        f"{MEILI_HOST}/indexes/{INDEX_UID}/settings/embedders",
-        headers=headers,
-        data=json.dumps(body),
-        timeout=120,
-    )
-    print(resp.status_code)
-    print(resp.text)
-    return 0 if resp.ok else 1
+    settings.apply({"embedders": body}, dry_run=dry_run)
+    return 0
 
 
 if __name__ == "__main__":
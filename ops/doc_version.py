@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+
+DOC_VERSION_MIGRATION = "meili_doc_version"
+PENDING_INDEX_NAME = "pipeline_jobs_meili_pending_idx"
+
+# The Meilisearch document version the pipeline stamps into meili_loaded_doc_version.
+# Takes the doc schema version as its only parameter.
+EXPECTED_DOC_VERSION_SQL = """md5(
+    concat_ws(
+        '|',
+        COALESCE(%s, ''),
+        COALESCE(content_hash, ''),
+        COALESCE(last_parsed_at::text, ''),
+        COALESCE(job_group, id)
+    )
+)"""
+
+# Must match the partial index predicate so the planner can use the index.
+STORED_PENDING_SQL = "meili_doc_version IS DISTINCT FROM meili_loaded_doc_version"
+STORED_LOADED_SQL = "meili_loaded_doc_version = meili_doc_version"
+
+
+def doc_version_column_ready(conn, schema_version: str) -> bool:
+    """True when meili_doc_version is maintained for the current schema version."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('ops_schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.commit()
+            return False
+        cur.execute(
+            "SELECT detail FROM ops_schema_migrations WHERE name = %s",
+            (DOC_VERSION_MIGRATION,),
+        )
+        row = cur.fetchone()
+    conn.commit()
+    return row is not None and row[0] == schema_version
+
+
+def pending_predicate(conn, schema_version: str) -> tuple[str, tuple[object, ...]]:
+    if doc_version_column_ready(conn, schema_version):
+        return STORED_PENDING_SQL, ()
+    return f"meili_loaded_doc_version IS DISTINCT FROM {EXPECTED_DOC_VERSION_SQL}", (schema_version,)
+
+
+def loaded_predicate(conn, schema_version: str) -> tuple[str, tuple[object, ...]]:
+    if doc_version_column_ready(conn, schema_version):
+        return STORED_LOADED_SQL, ()
+    return f"meili_loaded_doc_version = {EXPECTED_DOC_VERSION_SQL}", (schema_version,)
+
+
+REMOVED_TRACKING_MIGRATION = "meili_removed_at"
+REMOVED_PENDING_INDEX_NAME = "pipeline_jobs_meili_removed_pending_idx"
+
+# A removed row is pending deletion until meili_removed_at records the removal the
+# index has caught up with. Must match the partial index predicate.
+REMOVED_PENDING_SQL = "removed_at IS NOT NULL AND meili_removed_at IS DISTINCT FROM removed_at"
+
+
+def removed_tracking_ready(conn) -> bool:
+    """True when meili_removed_at exists and deletes can be tracked per row."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('ops_schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.commit()
+            return False
+        cur.execute(
+            "SELECT 1 FROM ops_schema_migrations WHERE name = %s",
+            (REMOVED_TRACKING_MIGRATION,),
+        )
+        row = cur.fetchone()
+    conn.commit()
+    return row is not None
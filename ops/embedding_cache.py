@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+# Rough per-entry bookkeeping (dict slot, tuple, array header) on top of key and row bytes.
+ENTRY_OVERHEAD_BYTES = 200
+# The disk tier drops expired rows, and the oldest rows beyond its entry cap, after
+# this many written rows or this long since the last prune, whichever comes first.
+DISK_PRUNE_EVERY_ROWS = 1000
+DISK_PRUNE_SECONDS = 600.0
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model: str, dims: int) -> bytes:
+    return hashlib.blake2b(f"{model}\0{dims}\0{text}".encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """LRU embedding cache bounded in bytes, with a TTL and an optional SQLite tier.
+
+    Rows are stored as read-only float32 arrays. Memory misses fall through to the
+    disk tier when ``disk_path`` is set, and disk hits are promoted back into memory.
+    The disk tier is pruned to the TTL and to ``disk_max_entries`` (0 for no cap)
+    as it is written, not just at startup.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_path: Path | None = None,
+        disk_max_entries: int = 0,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = max(0, disk_max_entries)
+        self._entries: OrderedDict[bytes, tuple[np.ndarray, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.disk_pruned = 0
+        self._disk_rows_since_prune = 0
+        self._disk_pruned_at = time.monotonic()
+        if disk_path is not None:
+            self._open_disk(disk_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self._db is not None
+
+    def get_many(self, keys: list[bytes]) -> list[np.ndarray | None]:
+        now = time.time()
+        found: list[np.ndarray | None] = [None] * len(keys)
+        with self._lock:
+            for idx, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                row, expires_at = entry
+                if expires_at <= now:
+                    self._remove(key)
+                    self.expired += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[idx] = row
+                self.hits += 1
+
+        missing = [idx for idx, row in enumerate(found) if row is None]
+        disk_hits = 0
+        if missing and self._db is not None:
+            for idx, (row, created_at) in self._read_disk([keys[idx] for idx in missing]).items():
+                found[missing[idx]] = row
+                disk_hits += 1
+                self._put_memory(keys[missing[idx]], row, created_at + self.ttl_seconds)
+        with self._lock:
+            self.disk_hits += disk_hits
+            self.misses += len(missing) - disk_hits
+        return found
+
+    def put_many(self, keys: list[bytes], rows: np.ndarray) -> None:
+        now = time.time()
+        frozen = []
+        for key, row in zip(keys, rows):
+            row = np.array(row, dtype=np.float32, copy=True)
+            row.flags.writeable = False
+            frozen.append((key, row))
+            self._put_memory(key, row, now + self.ttl_seconds)
+        if self._db is not None:
+            self._write_disk(frozen, now)
+
+    def stats(self) -> dict[str, object]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_path": str(self.disk_path) if self.disk_path is not None else None,
+            "disk_max_entries": self.disk_max_entries,
+            "disk_pruned": self.disk_pruned,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+                self._db = None
+
+    def _put_memory(self, key: bytes, row: np.ndarray, expires_at: float) -> None:
+        size = row.nbytes + len(key) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (row, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: bytes) -> None:
+        row, _ = self._entries.pop(key)
+        self._bytes -= row.nbytes + len(key) + ENTRY_OVERHEAD_BYTES
+
+    def _open_disk(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_created_at ON query_embeddings (created_at)")
+        self._prune_disk(db)
+        self._db = db
+
+    def _read_disk(self, keys: list[bytes]) -> dict[int, tuple[np.ndarray, float]]:
+        cutoff = time.time() - self.ttl_seconds
+        placeholders = ",".join("?" * len(keys))
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, vector, created_at FROM query_embeddings WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+        by_key = {key: (vector, created_at) for key, vector, created_at in rows if created_at >= cutoff}
+        found = {}
+        for idx, key in enumerate(keys):
+            hit = by_key.get(key)
+            if hit is not None:
+                row = np.frombuffer(hit[0], dtype=np.float32)
+                found[idx] = (row, hit[1])
+        return found
+
+    def _write_disk(self, rows: list[tuple[bytes, np.ndarray]], created_at: float) -> None:
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                [(key, row.tobytes(), created_at) for key, row in rows],
+            )
+            self._db.commit()
+            self._disk_rows_since_prune += len(rows)
+            if (
+                self._disk_rows_since_prune >= DISK_PRUNE_EVERY_ROWS
+                or time.monotonic() - self._disk_pruned_at >= DISK_PRUNE_SECONDS
+            ):
+                self._prune_disk(self._db)
+
+    def _prune_disk(self, db: sqlite3.Connection) -> None:
+        # Callers hold self._db_lock, or own ``db`` exclusively while opening it.
+        deleted = db.execute(
+            "DELETE FROM query_embeddings WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        ).rowcount
+        if self.disk_max_entries:
+            deleted += db.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                "SELECT key FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            ).rowcount
+        db.commit()
+        self.disk_pruned += deleted
+        self._disk_rows_since_prune = 0
+        self._disk_pruned_at = time.monotonic()
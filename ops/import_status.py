@@ -1,20 +1,38 @@
 from __future__ import annotations
 
+import argparse
 import json
 import os
+import re
 import sys
+import threading
+import time
 from dataclasses import asdict, dataclass
 from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from typing import Any
 
 import requests
 from dotenv import load_dotenv
 
+from doc_version import loaded_predicate, pending_predicate
+from pg_pool import ConnectionPool
+
 
 DOPEJOBS_ROOT = Path("/Users/aburkard/fun/dopejobs")
 PIPELINE_ROOT = Path("/Users/aburkard/fun/dope-jobs-pipeline")
 ENV_PATH = DOPEJOBS_ROOT / ".env"
+THROUGHPUT_WINDOW_SECONDS = float(os.environ.get("IMPORT_STATUS_WINDOW_SECONDS", "3600"))
+THROUGHPUT_MAX_TASKS = int(os.environ.get("IMPORT_STATUS_MAX_TASKS", "2000"))
+THROUGHPUT_TRACE_BATCHES = int(os.environ.get("IMPORT_STATUS_TRACE_BATCHES", "20"))
+THROUGHPUT_RATE_SLICES = 10
+TASK_PAGE_SIZE = 100
+ISO_DURATION_RE = re.compile(
+    r"P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?"
+)
+TRACE_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(ns|µs|us|ms|s|m|h)")
+TRACE_DURATION_UNITS = {"ns": 1e-9, "µs": 1e-6, "us": 1e-6, "ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0}
 
 
 @dataclass
@@ -35,46 +53,198 @@ def parse_timestamp(raw: str | None) -> datetime | None:
     return datetime.fromisoformat(raw.replace("Z", "+00:00")).astimezone(UTC)
 
 
-def estimate_throughput(recent_tasks: list[dict[str, Any]]) -> dict[str, float | int | None]:
-    succeeded = [task for task in recent_tasks if task.get("status") == "succeeded"]
-    if not succeeded:
-        return {
-            "recent_batches": 0,
-            "docs_per_second": None,
-            "seconds_remaining": None,
-            "hours_remaining": None,
-        }
-
-    total_docs = 0
-    total_seconds = 0.0
-    counted_batches = 0
-    for task in succeeded:
+def parse_duration(raw: str | None) -> float | None:
+    """Seconds from a Meilisearch duration: ISO 8601 ("PT1.5S", "P1DT2H") or trace style ("12.3ms")."""
+    if not raw:
+        return None
+    iso = ISO_DURATION_RE.fullmatch(raw)
+    if iso and any(iso.groups()):
+        days, hours, minutes, seconds = (float(part) if part else 0.0 for part in iso.groups())
+        return days * 86400 + hours * 3600 + minutes * 60 + seconds
+    trace = TRACE_DURATION_RE.fullmatch(raw.strip())
+    if trace:
+        return float(trace.group(1)) * TRACE_DURATION_UNITS[trace.group(2)]
+    return None
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_seconds(values: list[float], quantiles: tuple[float, ...]) -> dict[str, float | None]:
+    summary: dict[str, float | None] = {f"p{round(q * 100)}": percentile(values, q) for q in quantiles}
+    summary["max"] = max(values) if values else None
+    return summary
+
+
+def task_docs(task: dict[str, Any]) -> int:
+    details = task.get("details") or {}
+    return int(details.get("indexedDocuments") or details.get("receivedDocuments") or 0)
+
+
+def estimate_throughput(
+    tasks: list[dict[str, Any]],
+    pending_load: int,
+    batch_timings: dict[str, float | None] | None = None,
+) -> dict[str, Any]:
+    """Wall-clock indexing rate and ETA from succeeded document tasks.
+
+    The rate is measured between task completions, so queue waits and gaps
+    between batches count against it. ETA bounds use the spread of the rate
+    across consecutive slices of the window.
+    """
+    timed = []
+    for task in tasks:
+        if task.get("status") != "succeeded":
+            continue
+        enqueued_at = parse_timestamp(task.get("enqueuedAt"))
         started_at = parse_timestamp(task.get("startedAt"))
         finished_at = parse_timestamp(task.get("finishedAt"))
-        docs = (task.get("details") or {}).get("indexedDocuments") or (task.get("details") or {}).get("receivedDocuments") or 0
-        if not started_at or not finished_at or not docs:
-            continue
-        elapsed = (finished_at - started_at).total_seconds()
-        if elapsed <= 0:
+        docs = task_docs(task)
+        if not enqueued_at or not started_at or not finished_at or not docs:
             continue
-        total_docs += int(docs)
-        total_seconds += elapsed
-        counted_batches += 1
-
-    if total_docs <= 0 or total_seconds <= 0:
-        return {
-            "recent_batches": counted_batches,
-            "docs_per_second": None,
-            "seconds_remaining": None,
-            "hours_remaining": None,
-        }
-
-    docs_per_second = total_docs / total_seconds
+        timed.append((enqueued_at, started_at, finished_at, docs))
+    timed.sort(key=lambda item: item[2])
+
+    queue_waits = [(started - enqueued).total_seconds() for enqueued, started, _, _ in timed]
+    latencies = [(finished - enqueued).total_seconds() for enqueued, _, finished, _ in timed]
+    processing = [(finished - started).total_seconds() for _, started, finished, _ in timed]
+
+    # Autobatched tasks finish together; treat each distinct finish time as one completion.
+    completions: list[tuple[datetime, int]] = []
+    for _, _, finished_at, docs in timed:
+        if completions and completions[-1][0] == finished_at:
+            completions[-1] = (finished_at, completions[-1][1] + docs)
+        else:
+            completions.append((finished_at, docs))
+
+    docs_per_second = None
+    slice_rates: list[float] = []
+    if len(completions) >= 2:
+        # Docs of the first completion were indexed before the window opened.
+        intervals = [
+            ((finished - completions[i - 1][0]).total_seconds(), docs)
+            for i, (finished, docs) in enumerate(completions[1:], start=1)
+        ]
+        window_seconds = sum(seconds for seconds, _ in intervals)
+        if window_seconds > 0:
+            docs_per_second = sum(docs for _, docs in intervals) / window_seconds
+        slice_count = min(THROUGHPUT_RATE_SLICES, len(intervals))
+        for index in range(slice_count):
+            chunk = intervals[index * len(intervals) // slice_count:(index + 1) * len(intervals) // slice_count]
+            seconds = sum(seconds for seconds, _ in chunk)
+            if seconds > 0:
+                slice_rates.append(sum(docs for _, docs in chunk) / seconds)
+
+    def eta_hours(rate: float | None) -> float | None:
+        if not rate:
+            return None
+        return pending_load / rate / 3600.0
+
+    seconds_remaining = pending_load / docs_per_second if docs_per_second else None
     return {
-        "recent_batches": counted_batches,
+        "recent_batches": len(timed),
+        "window_start": completions[0][0].isoformat() if completions else None,
+        "window_end": completions[-1][0].isoformat() if completions else None,
         "docs_per_second": docs_per_second,
-        "seconds_remaining": None,
-        "hours_remaining": None,
+        "seconds_remaining": seconds_remaining,
+        "hours_remaining": seconds_remaining / 3600.0 if seconds_remaining is not None else None,
+        # Slow slices bound the ETA from above, fast slices from below.
+        "hours_remaining_low": eta_hours(percentile(slice_rates, 0.9)),
+        "hours_remaining_high": eta_hours(percentile(slice_rates, 0.1)),
+        "queue_wait_seconds": summarize_seconds(queue_waits, (0.5, 0.95)),
+        "enqueue_to_finish_seconds": summarize_seconds(latencies, (0.5, 0.9, 0.99)),
+        "processing_seconds": summarize_seconds(processing, (0.5, 0.95)),
+        "batch_timings": batch_timings or {},
+    }
+
+
+def meili_headers() -> dict[str, str]:
+    key = os.environ.get("MEILI_MASTER_KEY") or os.environ.get("MEILISEARCH_MASTER_KEY", "")
+    return {"Authorization": f"Bearer {key}"} if key else {}
+
+
+def fetch_task_history(host: str, window_seconds: float, max_tasks: int) -> list[dict[str, Any]]:
+    """Page back through succeeded document tasks until the window or cap is reached."""
+    since = datetime.now(UTC).timestamp() - window_seconds
+    tasks: list[dict[str, Any]] = []
+    params: dict[str, Any] = {
+        "indexUids": "jobs",
+        "types": "documentAdditionOrUpdate",
+        "statuses": "succeeded",
+        "limit": TASK_PAGE_SIZE,
+    }
+    while len(tasks) < max_tasks:
+        resp = requests.get(f"{host}/tasks", params=params, headers=meili_headers(), timeout=10)
+        resp.raise_for_status()
+        body = resp.json()
+        page = body.get("results", [])
+        for task in page:
+            finished_at = parse_timestamp(task.get("finishedAt"))
+            if finished_at is not None and finished_at.timestamp() < since:
+                return tasks
+            tasks.append(task)
+        if not page or body.get("next") is None:
+            break
+        params["from"] = body["next"]
+    return tasks[:max_tasks]
+
+
+def leaf_steps(trace: dict[str, Any]) -> dict[str, Any]:
+    """Progress-trace steps without sub-steps; a parent's time already includes its children's."""
+    parents = {
+        step
+        for step in trace
+        if any(other.startswith(step) and other[len(step):].lstrip().startswith(">") for other in trace)
+    }
+    return {step: duration for step, duration in trace.items() if step not in parents}
+
+
+def fetch_batch_timings(host: str, tasks: list[dict[str, Any]], limit: int) -> dict[str, float | None]:
+    """Split recent batch time into embedding vs. the rest using /batches progress traces."""
+    batch_uids = []
+    for task in tasks:
+        uid = task.get("batchUid")
+        if uid is not None and uid not in batch_uids:
+            batch_uids.append(uid)
+        if len(batch_uids) >= limit:
+            break
+
+    total_seconds = 0.0
+    embedding_seconds = 0.0
+    counted = 0
+    for uid in batch_uids:
+        try:
+            resp = requests.get(f"{host}/batches/{uid}", headers=meili_headers(), timeout=5)
+            resp.raise_for_status()
+        except requests.RequestException:
+            # Older Meilisearch versions have no /batches route.
+            break
+        batch = resp.json()
+        duration = parse_duration(batch.get("duration"))
+        trace = (batch.get("stats") or {}).get("progressTrace") or batch.get("progressTrace") or {}
+        if duration is None or not trace:
+            continue
+        total_seconds += duration
+        for step, raw_duration in leaf_steps(trace).items():
+            # Parents include their children's time; counting leaves only avoids double counting.
+            if "embed" in step.lower():
+                embedding_seconds += parse_duration(raw_duration) or 0.0
+        counted += 1
+
+    if not counted:
+        return {"batches": 0, "embedding_seconds": None, "indexing_seconds": None, "embedding_share": None}
+    return {
+        "batches": counted,
+        "embedding_seconds": embedding_seconds,
+        "indexing_seconds": max(total_seconds - embedding_seconds, 0.0),
+        "embedding_share": embedding_seconds / total_seconds if total_seconds else None,
     }
 
 
@@ -86,90 +256,54 @@ def load_pipeline_modules():
     return MEILI_DOC_SCHEMA_VERSION, get_connection
 
 
+def query_db_status(conn, meili_doc_schema_version: str) -> DbStatus:
+    pending_sql, pending_params = pending_predicate(conn, meili_doc_schema_version)
+    loaded_sql, loaded_params = loaded_predicate(conn, meili_doc_schema_version)
+    with conn.cursor() as cur:
+        # One pass over the active rows for every counter.
+        cur.execute(
+            f"""
+            SELECT
+                COUNT(*) AS active_raw,
+                COUNT(*) FILTER (WHERE {pending_sql}) AS pending_load,
+                COUNT(*) FILTER (WHERE last_parsed_at IS NOT NULL) AS parsed,
+                COUNT(*) FILTER (WHERE last_parsed_at IS NULL) AS unparsed,
+                COUNT(*) FILTER (
+                    WHERE last_parsed_at IS NOT NULL
+                      AND {loaded_sql}
+                ) AS parsed_loaded,
+                COUNT(*) FILTER (
+                    WHERE last_parsed_at IS NULL
+                      AND {loaded_sql}
+                ) AS unparsed_loaded
+            FROM pipeline_jobs
+            WHERE removed_at IS NULL
+              AND raw_json IS NOT NULL
+            """,
+            (*pending_params, *loaded_params, *loaded_params),
+        )
+        active_raw, pending_load, parsed, unparsed, parsed_loaded, unparsed_loaded = cur.fetchone()
+    conn.commit()
+
+    loaded = parsed_loaded + unparsed_loaded
+    percent_loaded = (loaded / active_raw * 100.0) if active_raw else 100.0
+    return DbStatus(
+        active_raw=active_raw,
+        pending_load=pending_load,
+        loaded=loaded,
+        parsed=parsed,
+        unparsed=unparsed,
+        parsed_loaded=parsed_loaded,
+        unparsed_loaded=unparsed_loaded,
+        percent_loaded=percent_loaded,
+    )
+
+
 def get_db_status() -> DbStatus:
     meili_doc_schema_version, get_connection = load_pipeline_modules()
     conn = get_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM pipeline_jobs
-                WHERE removed_at IS NULL
-                  AND raw_json IS NOT NULL
-                """
-            )
-            active_raw = cur.fetchone()[0]
-
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM pipeline_jobs
-                WHERE removed_at IS NULL
-                  AND raw_json IS NOT NULL
-                  AND meili_loaded_doc_version IS DISTINCT FROM md5(
-                      concat_ws(
-                          '|',
-                          COALESCE(%s, ''),
-                          COALESCE(content_hash, ''),
-                          COALESCE(last_parsed_at::text, ''),
-                          COALESCE(job_group, id)
-                      )
-                  )
-                """,
-                (meili_doc_schema_version,),
-            )
-            pending_load = cur.fetchone()[0]
-
-            cur.execute(
-                """
-                SELECT
-                    COUNT(*) FILTER (WHERE last_parsed_at IS NOT NULL) AS parsed,
-                    COUNT(*) FILTER (WHERE last_parsed_at IS NULL) AS unparsed,
-                    COUNT(*) FILTER (
-                        WHERE last_parsed_at IS NOT NULL
-                          AND meili_loaded_doc_version = md5(
-                              concat_ws(
-                                  '|',
-                                  COALESCE(%s, ''),
-                                  COALESCE(content_hash, ''),
-                                  COALESCE(last_parsed_at::text, ''),
-                                  COALESCE(job_group, id)
-                              )
-                          )
-                    ) AS parsed_loaded,
-                    COUNT(*) FILTER (
-                        WHERE last_parsed_at IS NULL
-                          AND meili_loaded_doc_version = md5(
-                              concat_ws(
-                                  '|',
-                                  COALESCE(%s, ''),
-                                  COALESCE(content_hash, ''),
-                                  COALESCE(last_parsed_at::text, ''),
-                                  COALESCE(job_group, id)
-                              )
-                          )
-                    ) AS unparsed_loaded
-                FROM pipeline_jobs
-                WHERE removed_at IS NULL
-                  AND raw_json IS NOT NULL
-                """,
-                (meili_doc_schema_version, meili_doc_schema_version),
-            )
-            parsed, unparsed, parsed_loaded, unparsed_loaded = cur.fetchone()
-
-        loaded = parsed_loaded + unparsed_loaded
-        percent_loaded = (loaded / active_raw * 100.0) if active_raw else 100.0
-        return DbStatus(
-            active_raw=active_raw,
-            pending_load=pending_load,
-            loaded=loaded,
-            parsed=parsed,
-            unparsed=unparsed,
-            parsed_loaded=parsed_loaded,
-            unparsed_loaded=unparsed_loaded,
-            percent_loaded=percent_loaded,
-        )
+        return query_db_status(conn, meili_doc_schema_version)
     finally:
         conn.close()
 
@@ -194,8 +328,7 @@ def meili_candidates() -> list[str]:
 
 
 def get_meili_status() -> dict[str, Any]:
-    key = os.environ.get("MEILI_MASTER_KEY") or os.environ.get("MEILISEARCH_MASTER_KEY", "")
-    headers = {"Authorization": f"Bearer {key}"} if key else {}
+    headers = meili_headers()
     errors: list[dict[str, str]] = []
 
     for host in meili_candidates():
@@ -244,20 +377,97 @@ def get_meili_status() -> dict[str, Any]:
     return {"errors": errors}
 
 
-def main() -> int:
-    db_status = get_db_status()
+def build_summary(db_status: DbStatus) -> dict[str, Any]:
     meili_status = get_meili_status()
-    rate = estimate_throughput(meili_status.get("recent_tasks", []))
-    if rate["docs_per_second"]:
-        seconds_remaining = db_status.pending_load / float(rate["docs_per_second"])
-        rate["seconds_remaining"] = seconds_remaining
-        rate["hours_remaining"] = seconds_remaining / 3600.0
+    history: list[dict[str, Any]] = []
+    batch_timings = None
+    if "host" in meili_status:
+        try:
+            history = fetch_task_history(meili_status["host"], THROUGHPUT_WINDOW_SECONDS, THROUGHPUT_MAX_TASKS)
+            batch_timings = fetch_batch_timings(meili_status["host"], history, THROUGHPUT_TRACE_BATCHES)
+        except requests.RequestException as exc:
+            meili_status.setdefault("errors", []).append({"host": meili_status["host"], "error": repr(exc)})
+    rate = estimate_throughput(history, db_status.pending_load, batch_timings)
 
-    summary = {
+    return {
         "db": asdict(db_status),
         "meili": meili_status,
         "throughput": rate,
     }
+
+
+class CachedStatus:
+    """Recomputes the summary at most once per TTL on one pooled connection."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.meili_doc_schema_version, get_connection = load_pipeline_modules()
+        self._pool = ConnectionPool(get_connection, max_size=1, label="import_status:db")
+        self._lock = threading.Lock()
+        self._summary: dict[str, Any] | None = None
+        self._computed_at = 0.0
+
+    def get(self) -> dict[str, Any]:
+        # Concurrent pollers wait on the lock and share one refresh.
+        with self._lock:
+            age = time.monotonic() - self._computed_at
+            if self._summary is None or age >= self.ttl_seconds:
+                self._summary = build_summary(self._pool.run(query_db_status, self.meili_doc_schema_version))
+                self._computed_at = time.monotonic()
+                self._summary["generated_at"] = datetime.now(UTC).isoformat()
+                age = 0.0
+            return {**self._summary, "cache_age_seconds": round(age, 3)}
+
+
+def serve(host: str, port: int, ttl_seconds: float) -> None:
+    status = CachedStatus(ttl_seconds)
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] not in {"/", "/status"}:
+                self.send_error(404)
+                return
+            try:
+                body = json.dumps(status.get(), sort_keys=True).encode()
+                code = 200
+            except Exception as exc:
+                body = json.dumps({"error": repr(exc)}).encode()
+                code = 503
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    print(f"Serving import status on http://{host}:{port}/status (ttl {ttl_seconds}s)", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true", help="Serve the JSON summary over HTTP instead of printing it")
+    parser.add_argument("--host", default=os.environ.get("IMPORT_STATUS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("IMPORT_STATUS_PORT", "8099")))
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=float(os.environ.get("IMPORT_STATUS_TTL_SECONDS", "30")),
+        help="Seconds to reuse a computed summary (--serve)",
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.host, args.port, args.ttl)
+        return 0
+
+    summary = build_summary(get_db_status())
     print(json.dumps(summary, indent=2, sort_keys=True))
     return 0
 
@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from embedding_cache import cache_key
+
+
+INDEX_CACHE_PATH = os.environ.get("PPLX_INDEX_CACHE_PATH", "/var/lib/dopejobs-embedder/index_cache.sqlite")
+# What the service applies to vectors before answering Meilisearch; see perplexity_embedder_service.py.
+QUANTIZE = os.environ.get("PPLX_QUANTIZE", "none").lower()
+SQLITE_MAX_VARIABLES = 900
+PREWARM_PAGE_SIZE = 500
+COMPACT_MAX_IDLE_DAYS = 30
+REPORT_DAYS = 14
+# Lookups only buffer last-used times and daily counts; they reach SQLite in one
+# transaction once this many keys are pending or this long has passed.
+TOUCH_FLUSH_KEYS = 2048
+TOUCH_FLUSH_SECONDS = 60.0
+
+
+class IndexEmbeddingStore:
+    """Content-addressed SQLite store of index-time document embeddings.
+
+    Keys hash the exact rendered document text with the model and output dims, so
+    an unchanged document is never embedded twice no matter which job it belongs
+    to. Daily hit/miss counts are kept alongside for reporting.
+
+    Lookups never write: last-used times and counts are buffered and flushed in
+    batches, and always before compaction and reporting read them. A crash loses
+    at most one buffer of touches, which only makes those entries look older.
+    """
+
+    def __init__(self, path: Path, model: str, dims: int) -> None:
+        self.path = path
+        self.model = model
+        self.dims = dims
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS index_embeddings ("
+            "key BLOB PRIMARY KEY, model TEXT NOT NULL, dims INTEGER NOT NULL, vector BLOB NOT NULL, "
+            "created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS index_cache_daily ("
+            "day TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Pending last_used_at per key and (hits, misses) per day, written by _flush().
+        self._touched: dict[bytes, float] = {}
+        self._daily: dict[str, list[int]] = {}
+        self._last_flush = time.monotonic()
+
+    def get_many(self, keys: list[bytes]) -> list[np.ndarray | None]:
+        now = time.time()
+        by_key: dict[bytes, bytes] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_MAX_VARIABLES):
+                chunk = unique[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM index_embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                by_key.update(rows)
+            self._touched.update(dict.fromkeys(by_key, now))
+            found = [
+                np.frombuffer(by_key[key], dtype=np.float32) if key in by_key else None
+                for key in keys
+            ]
+            hits = sum(1 for row in found if row is not None)
+            self._count(hits, len(keys) - hits)
+            if len(self._touched) >= TOUCH_FLUSH_KEYS or time.monotonic() - self._last_flush >= TOUCH_FLUSH_SECONDS:
+                self._flush()
+        return found
+
+    def put_many(self, keys: list[bytes], rows: np.ndarray) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO index_embeddings (key, model, dims, vector, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, self.model, self.dims, np.asarray(row, dtype=np.float32).tobytes(), now, now)
+                    for key, row in zip(keys, rows)
+                ],
+            )
+            self._db.commit()
+
+    def stats(self) -> dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def vectors(self, limit: int) -> np.ndarray:
+        """Up to ``limit`` stored vectors for the configured model and dims."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT vector FROM index_embeddings WHERE model = ? AND dims = ? LIMIT ?",
+                (self.model, self.dims, limit),
+            ).fetchall()
+        if not rows:
+            return np.empty((0, self.dims), dtype=np.float32)
+        return np.frombuffer(b"".join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), self.dims)
+
+    def compact(self, max_idle_days: float, keep_other_models: bool = False) -> int:
+        cutoff = time.time() - max_idle_days * 86400
+        with self._lock:
+            # Recent hits must land first or their entries look idle.
+            self._flush()
+            deleted = self._db.execute("DELETE FROM index_embeddings WHERE last_used_at < ?", (cutoff,)).rowcount
+            if not keep_other_models:
+                # Entries for a retired model or dimension can never hit again.
+                deleted += self._db.execute(
+                    "DELETE FROM index_embeddings WHERE model != ? OR dims != ?",
+                    (self.model, self.dims),
+                ).rowcount
+            self._db.commit()
+            self._db.execute("VACUUM")
+        return deleted
+
+    def summary(self, days: int) -> dict[str, object]:
+        since = (datetime.now(UTC).date() - timedelta(days=days - 1)).isoformat()
+        with self._lock:
+            self._flush()
+            by_model = self._db.execute(
+                "SELECT model, dims, COUNT(*), MAX(last_used_at) FROM index_embeddings GROUP BY model, dims"
+            ).fetchall()
+            daily = self._db.execute(
+                "SELECT day, hits, misses FROM index_cache_daily WHERE day >= ? ORDER BY day",
+                (since,),
+            ).fetchall()
+        hits = sum(row[1] for row in daily)
+        misses = sum(row[2] for row in daily)
+        return {
+            "path": str(self.path),
+            "bytes": self.path.stat().st_size,
+            "entries": [
+                {
+                    "model": model,
+                    "dims": dims,
+                    "count": count,
+                    "last_used_at": datetime.fromtimestamp(last_used, UTC).isoformat() if last_used else None,
+                }
+                for model, dims, count, last_used in by_model
+            ],
+            "days": days,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "daily": [{"day": day, "hits": day_hits, "misses": day_misses} for day, day_hits, day_misses in daily],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def _count(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+        daily = self._daily.setdefault(datetime.now(UTC).date().isoformat(), [0, 0])
+        daily[0] += hits
+        daily[1] += misses
+
+    def _flush(self) -> None:
+        # Callers hold self._lock.
+        if self._touched:
+            self._db.executemany(
+                "UPDATE index_embeddings SET last_used_at = MAX(last_used_at, ?) WHERE key = ?",
+                [(used_at, key) for key, used_at in self._touched.items()],
+            )
+        if self._daily:
+            self._db.executemany(
+                "INSERT INTO index_cache_daily (day, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT (day) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(day, hits, misses) for day, (hits, misses) in self._daily.items()],
+            )
+        self._db.commit()
+        self._touched.clear()
+        self._daily.clear()
+        self._last_flush = time.monotonic()
+
+
+def log(*parts: object) -> None:
+    print(datetime.now(UTC).isoformat(), *parts, flush=True)
+
+
+def render_document_template(template: str, max_bytes: int):
+    """Returns doc -> text rendered the way Meilisearch renders ``documentTemplate``."""
+    try:
+        from liquid import Template
+    except ImportError as exc:
+        raise SystemExit("prewarm needs python-liquid: pip install python-liquid") from exc
+
+    compiled = Template(template)
+
+    def render(doc: dict) -> str:
+        text = compiled.render(doc=doc)
+        encoded = text.encode()
+        if len(encoded) > max_bytes:
+            text = encoded[:max_bytes].decode(errors="ignore")
+        return text
+
+    return render
+
+
+def stored_vector(doc: dict, embedder: str) -> list[float] | None:
+    entry = (doc.get("_vectors") or {}).get(embedder)
+    embeddings = entry.get("embeddings") if isinstance(entry, dict) else entry
+    if not embeddings:
+        return None
+    if isinstance(embeddings[0], list):
+        return embeddings[0]
+    return embeddings
+
+
+def iter_meili_document_pages(limit: int | None, page_size: int = PREWARM_PAGE_SIZE):
+    """Yields pages of indexed documents with their stored vectors."""
+    import requests
+
+    from apply_perplexity_meili_embedder import INDEX_UID, MEILI_HOST, MEILI_KEY
+
+    headers = {"Authorization": f"Bearer {MEILI_KEY}"} if MEILI_KEY else {}
+    offset = 0
+    while limit is None or offset < limit:
+        size = page_size if limit is None else min(page_size, limit - offset)
+        resp = requests.post(
+            f"{MEILI_HOST}/indexes/{INDEX_UID}/documents/fetch",
+            headers=headers,
+            json={"offset": offset, "limit": size, "retrieveVectors": True},
+            timeout=120,
+        )
+        resp.raise_for_status()
+        docs = resp.json().get("results", [])
+        if not docs:
+            return
+        offset += len(docs)
+        yield docs
+
+
+def prewarm_refusal(embedder_settings: dict | None, quantize: str) -> str | None:
+    """Why the index's stored vectors can't seed the cache, or None if they can.
+
+    The cache must hold the vectors upstream returned. Meilisearch stores what the
+    service answered after PPLX_QUANTIZE, and binaryQuantized keeps only signs, so
+    either would poison every later cache hit.
+    """
+    if quantize != "none":
+        return f"PPLX_QUANTIZE={quantize}, so the stored vectors are already quantized"
+    if (embedder_settings or {}).get("binaryQuantized"):
+        return "the embedder has binaryQuantized enabled, so the stored vectors are sign bits"
+    return None
+
+
+def fetch_embedder_settings(embedder: str) -> dict | None:
+    from apply_perplexity_meili_embedder import INDEX_UID, MEILI_HOST, MEILI_KEY
+    from meili_settings import MeiliSettings
+
+    return (MeiliSettings(MEILI_HOST, INDEX_UID, MEILI_KEY).fetch().get("embedders") or {}).get(embedder)
+
+
+def prewarm(store: IndexEmbeddingStore, embedder: str, limit: int | None) -> None:
+    from apply_perplexity_meili_embedder import DOCUMENT_TEMPLATE, DOCUMENT_TEMPLATE_MAX_BYTES
+
+    refusal = prewarm_refusal(fetch_embedder_settings(embedder), QUANTIZE)
+    if refusal:
+        raise SystemExit(f"refusing to prewarm from the index: {refusal}")
+    render = render_document_template(DOCUMENT_TEMPLATE, DOCUMENT_TEMPLATE_MAX_BYTES)
+    seen = 0
+    stored = 0
+    skipped = 0
+    for docs in iter_meili_document_pages(limit):
+        keys = []
+        rows = []
+        for doc in docs:
+            vector = stored_vector(doc, embedder)
+            if vector is None or len(vector) != store.dims:
+                skipped += 1
+                continue
+            keys.append(cache_key(render(doc), store.model, store.dims))
+            rows.append(vector)
+        if keys:
+            store.put_many(keys, np.asarray(rows, dtype=np.float32))
+        stored += len(keys)
+        seen += len(docs)
+        log("prewarm:page", "offset", seen, "stored", stored, "skipped", skipped)
+    log("prewarm:done", "stored", stored, "skipped", skipped)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain the index-time embedding cache.")
+    parser.add_argument("command", choices=["prewarm", "compact", "report"])
+    parser.add_argument("--path", default=INDEX_CACHE_PATH)
+    parser.add_argument("--embedder", default="default", help="Meilisearch embedder whose vectors seed the cache")
+    parser.add_argument("--limit", type=int, default=None, help="Prewarm at most this many documents")
+    parser.add_argument("--max-idle-days", type=float, default=COMPACT_MAX_IDLE_DAYS)
+    parser.add_argument(
+        "--keep-other-models",
+        action="store_true",
+        help="Compact: keep entries for models/dims other than the configured ones",
+    )
+    parser.add_argument("--days", type=int, default=REPORT_DAYS)
+    args = parser.parse_args()
+
+    from apply_perplexity_meili_embedder import EMBED_DIM, MODEL_ID
+
+    store = IndexEmbeddingStore(Path(args.path), MODEL_ID, EMBED_DIM)
+    try:
+        if args.command == "prewarm":
+            prewarm(store, args.embedder, args.limit)
+        elif args.command == "compact":
+            deleted = store.compact(args.max_idle_days, keep_other_models=args.keep_other_models)
+            log("compact:done", "deleted", deleted, "bytes", store.path.stat().st_size)
+        else:
+            print(json.dumps(store.summary(args.days), indent=2))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
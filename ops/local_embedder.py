@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class LocalEmbedder:
+    """Runs a sentence-transformers model in-process on a small thread pool.
+
+    ``runtime`` is ``"torch"`` or ``"onnx"`` (sentence-transformers' ONNX Runtime
+    backend). Each of the ``workers`` threads runs a whole batch, and
+    ``intra_op_threads`` caps the threads one forward pass may use, so
+    ``workers * intra_op_threads`` should not exceed the cores available.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        *,
+        runtime: str = "torch",
+        device: str = "cpu",
+        workers: int = 1,
+        intra_op_threads: int = 0,
+        prompt: str | None = None,
+    ) -> None:
+        self.model_id = model_id
+        self.runtime = runtime
+        self.device = device
+        self.workers = max(1, workers)
+        self.intra_op_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.prompt = prompt or None
+        self._model = None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pplx-local")
+
+    def load(self) -> None:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(self.intra_op_threads)
+        kwargs = {}
+        if self.runtime == "onnx":
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.intra_op_threads
+            session_options.inter_op_num_threads = 1
+            kwargs = {
+                "backend": "onnx",
+                "model_kwargs": {"provider": "CPUExecutionProvider", "session_options": session_options},
+            }
+        elif self.runtime != "torch":
+            raise ValueError(f"unsupported local runtime: {self.runtime}")
+        self._model = SentenceTransformer(self.model_id, device=self.device, trust_remote_code=True, **kwargs)
+
+    async def embed(self, inputs: list[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._encode, inputs)
+
+    def info(self) -> dict[str, object]:
+        return {
+            "model": self.model_id,
+            "runtime": self.runtime,
+            "device": self.device,
+            "workers": self.workers,
+            "intra_op_threads": self.intra_op_threads,
+            "prompt": self.prompt,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._model = None
+
+    def _encode(self, inputs: list[str]) -> np.ndarray:
+        if self._model is None:
+            raise RuntimeError("local embedding model is not loaded")
+        kwargs = {"prompt": self.prompt} if self.prompt else {}
+        return self._model.encode(
+            inputs,
+            batch_size=max(1, len(inputs)),
+            convert_to_numpy=True,
+            normalize_embeddings=False,
+            **kwargs,
+        )
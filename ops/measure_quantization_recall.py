@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from index_embedding_cache import (
+    INDEX_CACHE_PATH,
+    IndexEmbeddingStore,
+    iter_meili_document_pages,
+    log,
+    stored_vector,
+)
+from vector_quantization import QUANTIZE_MODES, l2_normalize, quantize, recall_at_k, top_k, truncate_dims
+
+
+SEARCH_EMBED_URL = os.environ.get("PPLX_SEARCH_EMBED_URL", "http://127.0.0.1:8087/search-embed")
+CORPUS_LIMIT = 50_000
+SAMPLE_QUERIES = 500
+QUERY_BATCH_SIZE = 32
+
+
+def load_corpus(source: str, limit: int, cache_path: str, embedder: str) -> np.ndarray:
+    from apply_perplexity_meili_embedder import EMBED_DIM, MODEL_ID
+
+    if source == "cache":
+        store = IndexEmbeddingStore(Path(cache_path), MODEL_ID, EMBED_DIM)
+        try:
+            return store.vectors(limit)
+        finally:
+            store.close()
+
+    rows = []
+    for docs in iter_meili_document_pages(limit):
+        rows.extend(vector for vector in (stored_vector(doc, embedder) for doc in docs) if vector)
+        log("recall:corpus", len(rows))
+    return np.asarray(rows, dtype=np.float32)
+
+
+def embed_queries(path: Path) -> np.ndarray:
+    import requests
+
+    queries = [line.strip() for line in path.read_text().splitlines() if line.strip()]
+    rows = []
+    for start in range(0, len(queries), QUERY_BATCH_SIZE):
+        resp = requests.post(
+            SEARCH_EMBED_URL,
+            json={"inputs": queries[start:start + QUERY_BATCH_SIZE]},
+            timeout=120,
+        )
+        resp.raise_for_status()
+        rows.extend(item["values"] for item in resp.json()["embeddings"])
+    return np.asarray(rows, dtype=np.float32)
+
+
+def bytes_per_vector(dims: int, mode: str) -> float:
+    return {"none": dims * 4, "int8": dims, "binary": dims / 8}[mode]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Recall@k of truncated/quantized vectors against full-precision vectors."
+    )
+    parser.add_argument("--source", choices=["cache", "meili"], default="cache")
+    parser.add_argument("--cache-path", default=INDEX_CACHE_PATH)
+    parser.add_argument("--embedder", default="default")
+    parser.add_argument("--limit", type=int, default=CORPUS_LIMIT, help="Corpus size")
+    parser.add_argument(
+        "--queries",
+        type=Path,
+        help="Text file of search queries, one per line, embedded through the proxy "
+        "(run it with PPLX_QUANTIZE=none). Defaults to held-out corpus documents.",
+    )
+    parser.add_argument("--sample-queries", type=int, default=SAMPLE_QUERIES)
+    parser.add_argument("--dims", default="128,256,384,512")
+    parser.add_argument("--modes", default=",".join(QUANTIZE_MODES))
+    parser.add_argument("--k", default="10,100")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = l2_normalize(load_corpus(args.source, args.limit, args.cache_path, args.embedder))
+    if args.queries is not None:
+        queries = l2_normalize(embed_queries(args.queries))
+    else:
+        # Held-out documents as queries, removed from the corpus so they can't match themselves.
+        rng = np.random.default_rng(args.seed)
+        picked = rng.choice(corpus.shape[0], size=min(args.sample_queries, corpus.shape[0] // 2), replace=False)
+        queries = corpus[picked]
+        corpus = np.delete(corpus, picked, axis=0)
+    if not corpus.size or not queries.size:
+        raise SystemExit("no vectors to measure")
+    if queries.shape[1] != corpus.shape[1]:
+        raise SystemExit(f"query dims {queries.shape[1]} != corpus dims {corpus.shape[1]}")
+
+    full_dims = corpus.shape[1]
+    ks = sorted({int(k) for k in args.k.split(",")})
+    reference = top_k(queries, corpus, max(ks))
+    results = []
+    for dims in sorted({int(d) for d in args.dims.split(",") if 0 < int(d) <= full_dims}):
+        truncated_queries = truncate_dims(queries, dims)
+        truncated_corpus = truncate_dims(corpus, dims)
+        for mode in args.modes.split(","):
+            candidate = top_k(
+                quantize(truncated_queries, mode),
+                quantize(truncated_corpus, mode),
+                max(ks),
+            )
+            results.append(
+                {
+                    "dims": dims,
+                    "mode": mode,
+                    "bytes_per_vector": bytes_per_vector(dims, mode),
+                    **{f"recall@{k}": round(recall_at_k(reference[:, :k], candidate[:, :k]), 4) for k in ks},
+                }
+            )
+            log("recall:measured", results[-1])
+
+    print(
+        json.dumps(
+            {
+                "corpus": int(corpus.shape[0]),
+                "queries": int(queries.shape[0]),
+                "full_dims": full_dims,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable
+
+import requests
+
+from doc_version import REMOVED_PENDING_SQL, removed_tracking_ready
+from meili_reload import BACKPRESSURE_SLEEP_SECONDS, meili_queue_depth
+from pg_pool import DEFAULT_RETRY, ConnectionPool, log, with_retries
+
+
+TASK_POLL_SECONDS = 1
+TASK_TIMEOUT_SECONDS = 30 * 60
+
+# Boards whose every row is removed; deleting them by filter is one task instead
+# of one per id chunk.
+REMOVED_BOARDS_SQL = f"""
+    SELECT pj.ats, pj.board_token, COUNT(*), MAX(pj.removed_at)
+    FROM pipeline_jobs pj
+    WHERE {REMOVED_PENDING_SQL}
+    GROUP BY pj.ats, pj.board_token
+    HAVING COUNT(*) >= %s
+       AND NOT EXISTS (
+           SELECT 1
+           FROM pipeline_jobs active
+           WHERE active.ats = pj.ats
+             AND active.board_token = pj.board_token
+             AND active.removed_at IS NULL
+       )
+    ORDER BY COUNT(*) DESC, pj.ats, pj.board_token
+"""
+
+MARK_IDS_DELETED_SQL = """
+    UPDATE pipeline_jobs pj
+    SET meili_removed_at = deleted.removed_at,
+        meili_loaded_doc_version = NULL
+    FROM unnest(%s::text[], %s::timestamptz[]) AS deleted(id, removed_at)
+    WHERE pj.id = deleted.id
+      AND pj.removed_at = deleted.removed_at
+"""
+
+MARK_BOARD_DELETED_SQL = f"""
+    UPDATE pipeline_jobs
+    SET meili_removed_at = removed_at,
+        meili_loaded_doc_version = NULL
+    WHERE ats = %s
+      AND board_token = %s
+      AND {REMOVED_PENDING_SQL}
+      AND removed_at <= %s
+"""
+
+# A row that came back between the board check and the filter delete lost its
+# document along with the rest of the board; make the reload put it back.
+RELOAD_BOARD_ACTIVE_SQL = """
+    UPDATE pipeline_jobs
+    SET meili_loaded_doc_version = NULL
+    WHERE ats = %s
+      AND board_token = %s
+      AND removed_at IS NULL
+      AND meili_loaded_doc_version IS NOT NULL
+"""
+
+
+def meili_filter_value(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class RemovedIdCursor:
+    """Keyset walk over removed job ids still to be deleted from the index.
+
+    With ``meili_removed_at`` tracking the walk only visits removals the index has
+    not caught up with; without it every removed row is visited, as before.
+    """
+
+    def __init__(self, tracked: bool) -> None:
+        self.tracked = tracked
+        self.last_id = ""
+
+    def fetch(self, conn, limit: int) -> list[tuple[str, datetime]]:
+        predicate = REMOVED_PENDING_SQL if self.tracked else "removed_at IS NOT NULL"
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id, removed_at
+                FROM pipeline_jobs
+                WHERE {predicate}
+                  AND id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (self.last_id, limit),
+            )
+            rows = [(row[0], row[1]) for row in cur.fetchall()]
+        conn.commit()
+        if rows:
+            self.last_id = rows[-1][0]
+        return rows
+
+
+class RemovedDocDeleter:
+    """Deletes removed jobs from Meilisearch without holding the removed set in memory.
+
+    Boards with at least ``board_filter_min_ids`` pending deletes and no active
+    rows are deleted with one filter task each. The remaining ids are streamed in
+    ``chunk_size`` chunks through ``step_load`` on up to ``max_in_flight`` threads,
+    held back while the task queue is deeper than ``max_queue_depth``. Each
+    deleted row records its removal in ``meili_removed_at``, so later runs skip it.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool: ConnectionPool,
+        step_load: Callable[..., object],
+        meili_host: str,
+        meili_key: str,
+        index_uid: str,
+        chunk_size: int,
+        max_in_flight: int,
+        max_queue_depth: int,
+        board_filter_min_ids: int,
+    ) -> None:
+        self.pool = pool
+        self.step_load = step_load
+        self.meili_host = meili_host.rstrip("/")
+        self.meili_key = meili_key
+        self.index_uid = index_uid
+        self.chunk_size = max(1, chunk_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue_depth = max_queue_depth
+        self.board_filter_min_ids = board_filter_min_ids
+        self.headers = {"Authorization": f"Bearer {meili_key}"} if meili_key else {}
+
+    def run(self) -> dict[str, int]:
+        tracked = with_retries("meili:delete:tracking", lambda: self.pool.run(removed_tracking_ready))
+        if not tracked:
+            log("meili:delete:untracked", "deleting every removed id; run migrate_ops_schema.py apply")
+
+        totals = {"boards": 0, "board_docs": 0, "ids": 0}
+        if tracked and self.board_filter_min_ids > 0:
+            totals["boards"], totals["board_docs"] = self._delete_removed_boards()
+        totals["ids"] = self._delete_removed_ids(tracked)
+        log("meili:delete:done", totals)
+        return totals
+
+    def _delete_removed_boards(self) -> tuple[int, int]:
+        def fetch_boards(conn) -> list[tuple[str, str, int, datetime]]:
+            with conn.cursor() as cur:
+                cur.execute(REMOVED_BOARDS_SQL, (self.board_filter_min_ids,))
+                rows = cur.fetchall()
+            conn.commit()
+            return rows
+
+        boards = with_retries("meili:delete:boards", lambda: self.pool.run(fetch_boards))
+        deleted_boards = 0
+        deleted_docs = 0
+        for ats, board_token, pending, removed_through in boards:
+            self._wait_for_queue_room()
+            task = with_retries(
+                f"meili:delete:board:{ats}/{board_token}",
+                lambda: self._delete_by_filter(
+                    f"ats_type = {meili_filter_value(ats)} AND company_slug = {meili_filter_value(board_token)}"
+                ),
+            )
+            deleted = int((task.get("details") or {}).get("deletedDocuments") or 0)
+            if deleted == 0:
+                # Either already gone or the board's documents are keyed differently;
+                # the id walk settles it either way.
+                log("meili:delete:board:no_match", f"{ats}/{board_token}", "pending", pending)
+                continue
+
+            def mark_board(conn) -> int:
+                with conn.cursor() as cur:
+                    cur.execute(MARK_BOARD_DELETED_SQL, (ats, board_token, removed_through))
+                    marked = cur.rowcount
+                    cur.execute(RELOAD_BOARD_ACTIVE_SQL, (ats, board_token))
+                conn.commit()
+                return marked
+
+            marked = with_retries(f"meili:delete:board:{ats}/{board_token}:mark", lambda: self.pool.run(mark_board))
+            deleted_boards += 1
+            deleted_docs += deleted
+            log("meili:delete:board", f"{ats}/{board_token}", "deleted", deleted, "marked", marked)
+        return deleted_boards, deleted_docs
+
+    def _delete_removed_ids(self, tracked: bool) -> int:
+        cursor = RemovedIdCursor(tracked)
+        chunk_num = 0
+        total = 0
+        futures: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="meili-delete") as executor:
+            while True:
+                rows = with_retries(
+                    "meili:delete:ids",
+                    lambda: self.pool.run(cursor.fetch, self.chunk_size),
+                )
+                if not rows:
+                    break
+
+                while len(futures) >= self.max_in_flight:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                self._wait_for_queue_room()
+
+                chunk_num += 1
+                total += len(rows)
+                log("meili:delete:chunk", chunk_num, "size", len(rows), "last", rows[-1][0], "total", total)
+                futures.add(executor.submit(self._delete_chunk, chunk_num, rows, tracked))
+
+            for future in futures:
+                future.result()
+        return total
+
+    def _delete_chunk(self, chunk_num: int, rows: list[tuple[str, datetime]], tracked: bool) -> None:
+        ids = [job_id for job_id, _ in rows]
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.pool.connection() as conn:
+                    self.step_load(
+                        conn,
+                        meili_host=self.meili_host,
+                        meili_key=self.meili_key,
+                        parsed_job_ids=[],
+                        removed_job_ids=ids,
+                        meili_batch_size=self.chunk_size,
+                    )
+                    if tracked:
+                        with conn.cursor() as cur:
+                            cur.execute(MARK_IDS_DELETED_SQL, (ids, [removed_at for _, removed_at in rows]))
+                        conn.commit()
+                return
+            except Exception as exc:
+                log(f"meili:delete:chunk:{chunk_num}:retry", attempt, "error", repr(exc))
+                if attempt >= DEFAULT_RETRY.attempts:
+                    raise
+                time.sleep(DEFAULT_RETRY.delay(attempt))
+
+    def _wait_for_queue_room(self) -> None:
+        if self.max_queue_depth <= 0:
+            return
+        while True:
+            depth = meili_queue_depth(self.meili_host, self.meili_key, self.index_uid)
+            if depth is None or depth < self.max_queue_depth:
+                return
+            log("meili:delete:backpressure", "queue_depth", depth, "max", self.max_queue_depth)
+            time.sleep(BACKPRESSURE_SLEEP_SECONDS)
+
+    def _delete_by_filter(self, filter_expr: str) -> dict:
+        resp = requests.post(
+            f"{self.meili_host}/indexes/{self.index_uid}/documents/delete",
+            json={"filter": filter_expr},
+            headers=self.headers,
+            timeout=30,
+        )
+        resp.raise_for_status()
+        return self._wait_for_task(resp.json()["taskUid"])
+
+    def _wait_for_task(self, task_uid: int) -> dict:
+        deadline = time.monotonic() + TASK_TIMEOUT_SECONDS
+        while True:
+            resp = requests.get(f"{self.meili_host}/tasks/{task_uid}", headers=self.headers, timeout=30)
+            resp.raise_for_status()
+            task = resp.json()
+            status = task.get("status")
+            if status == "succeeded":
+                return task
+            if status in {"failed", "canceled"}:
+                raise RuntimeError(f"Meilisearch task {task_uid} {status}: {task.get('error')}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Meilisearch task {task_uid} still {status}")
+            time.sleep(TASK_POLL_SECONDS)
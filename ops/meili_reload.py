@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Callable
+
+import requests
+
+from doc_version import pending_predicate
+from pg_pool import DEFAULT_RETRY, ConnectionPool, log
+
+
+BACKPRESSURE_SLEEP_SECONDS = 2
+PENDING_POLL_SECONDS = 2
+
+
+def meili_queue_depth(meili_host: str, meili_key: str, index_uid: str) -> int | None:
+    headers = {"Authorization": f"Bearer {meili_key}"} if meili_key else {}
+    try:
+        resp = requests.get(
+            f"{meili_host.rstrip('/')}/tasks",
+            params={"indexUids": index_uid, "statuses": "enqueued,processing", "limit": 1},
+            headers=headers,
+            timeout=10,
+        )
+        resp.raise_for_status()
+        body = resp.json()
+    except (requests.RequestException, ValueError) as exc:
+        log("meili:queue_depth:error", repr(exc))
+        return None
+    total = body.get("total")
+    if total is None:
+        return len(body.get("results", []))
+    return int(total)
+
+
+class PendingIdCursor:
+    """Keyset walk over pending job ids in id order.
+
+    Each fetch only scans forward from the last id returned, so one pass over
+    ``pipeline_jobs`` costs O(N) instead of recomputing the pending set per batch.
+    Once ``meili_doc_version`` is migrated, the walk is a scan of the partial
+    pending index rather than the table.
+    """
+
+    def __init__(self, schema_version: str, start_after: str = "") -> None:
+        self.schema_version = schema_version
+        self.start_after = start_after
+        self.last_id = start_after
+        self._predicate: tuple[str, tuple[object, ...]] | None = None
+
+    def fetch(self, conn, limit: int) -> list[str]:
+        if self._predicate is None:
+            self._predicate = pending_predicate(conn, self.schema_version)
+        predicate, predicate_params = self._predicate
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id
+                FROM pipeline_jobs
+                WHERE removed_at IS NULL
+                  AND raw_json IS NOT NULL
+                  AND {predicate}
+                  AND id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (*predicate_params, self.last_id, limit),
+            )
+            ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        if ids:
+            self.last_id = ids[-1]
+        return ids
+
+    def restart(self) -> None:
+        self.start_after = ""
+        self.last_id = ""
+        self._predicate = None
+
+
+class ReloadCheckpoint:
+    """Persists the highest id below which every dispatched batch has loaded."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._next_seq = 0
+        self._done_through = -1
+        self._last_ids: dict[int, str] = {}
+        self._done: set[int] = set()
+
+    def load(self) -> str:
+        try:
+            return str(json.loads(self.path.read_text()).get("last_id") or "")
+        except FileNotFoundError:
+            return ""
+        except (OSError, ValueError) as exc:
+            log("meili:checkpoint:unreadable", str(self.path), repr(exc))
+            return ""
+
+    def dispatched(self, last_id: str) -> int:
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._last_ids[seq] = last_id
+            return seq
+
+    def completed(self, seq: int) -> None:
+        with self._lock:
+            self._done.add(seq)
+            last_id = None
+            while self._done_through + 1 in self._done:
+                self._done_through += 1
+                self._done.discard(self._done_through)
+                last_id = self._last_ids.pop(self._done_through)
+            if last_id is not None:
+                self._write(last_id)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._write("")
+
+    def clear(self) -> None:
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _write(self, last_id: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"last_id": last_id, "updated_at": datetime.now(UTC).isoformat()}) + "\n"
+        )
+        os.replace(tmp_path, self.path)
+
+
+class PipelinedLoader:
+    """Overlaps pending-id fetches, document building and Meilisearch indexing.
+
+    A prefetch thread walks ``cursor`` and keeps up to ``prefetch_batches`` pending
+    batches queued while ``max_in_flight`` worker threads run ``step_load`` on
+    connections from ``pool``. New batches are held back while the Meilisearch task queue is
+    deeper than ``max_queue_depth``.
+
+    The walk repeats from the first id until a full pass finds nothing pending, so
+    rows that changed behind the cursor are still picked up. When ``checkpoint`` is
+    given, a restarted run resumes its first pass after the last fully loaded id.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool: ConnectionPool,
+        cursor: PendingIdCursor,
+        step_load: Callable[..., object],
+        meili_host: str,
+        meili_key: str,
+        index_uid: str,
+        batch_size: int,
+        max_in_flight: int,
+        prefetch_batches: int,
+        max_queue_depth: int,
+        checkpoint: ReloadCheckpoint | None = None,
+    ) -> None:
+        self.pool = pool
+        self.cursor = cursor
+        self.checkpoint = checkpoint
+        self.step_load = step_load
+        self.meili_host = meili_host
+        self.meili_key = meili_key
+        self.index_uid = index_uid
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.prefetch_batches = max(1, prefetch_batches)
+        self.max_queue_depth = max_queue_depth
+
+        self._batches: queue.Queue[tuple[int, list[str]]] = queue.Queue(maxsize=self.prefetch_batches)
+        self._stop = threading.Event()
+        self._prefetch_error: BaseException | None = None
+        # Batches handed to the loader but not yet loaded; a new pass waits for zero.
+        self._outstanding = 0
+        self._outstanding_lock = threading.Lock()
+
+    def run(self) -> int:
+        prefetcher = threading.Thread(target=self._prefetch, name="meili-prefetch", daemon=True)
+        prefetcher.start()
+
+        batch_num = 0
+        total_loaded = 0
+        futures: set[Future] = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="meili-load") as executor:
+                while True:
+                    batch = self._next_batch()
+                    if batch is None:
+                        break
+                    seq, pending_ids = batch
+
+                    while len(futures) >= self.max_in_flight:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    self._wait_for_queue_room()
+
+                    batch_num += 1
+                    total_loaded += len(pending_ids)
+                    log(
+                        "meili:batch",
+                        batch_num,
+                        "size",
+                        len(pending_ids),
+                        "first",
+                        pending_ids[0],
+                        "last",
+                        pending_ids[-1],
+                        "total_loaded",
+                        total_loaded,
+                        "in_flight",
+                        len(futures) + 1,
+                    )
+                    futures.add(executor.submit(self._load_batch, batch_num, seq, pending_ids))
+
+                for future in futures:
+                    future.result()
+        finally:
+            self._stop.set()
+            prefetcher.join(timeout=30)
+
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+        log("meili:done_no_pending", "total_loaded", total_loaded)
+        return total_loaded
+
+    def _next_batch(self) -> tuple[int, list[str]] | None:
+        while True:
+            try:
+                return self._batches.get(timeout=1)
+            except queue.Empty:
+                if self._prefetch_error is not None:
+                    raise self._prefetch_error
+                if self._stop.is_set():
+                    return None
+
+    def _wait_for_queue_room(self) -> None:
+        if self.max_queue_depth <= 0:
+            return
+        while True:
+            depth = meili_queue_depth(self.meili_host, self.meili_key, self.index_uid)
+            if depth is None or depth < self.max_queue_depth:
+                return
+            log("meili:backpressure", "queue_depth", depth, "max", self.max_queue_depth)
+            time.sleep(BACKPRESSURE_SLEEP_SECONDS)
+
+    def _put(self, item: tuple[int, list[str]]) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _prefetch(self) -> None:
+        dispatched_this_pass = 0
+        failures = 0
+        log("meili:pass:start", "after", repr(self.cursor.last_id))
+        try:
+            while not self._stop.is_set():
+                try:
+                    with self.pool.connection() as conn:
+                        pending_ids = self.cursor.fetch(conn, self.batch_size)
+                    failures = 0
+                except Exception as exc:
+                    failures += 1
+                    log("meili:pending:retry", "after", repr(self.cursor.last_id), "error", repr(exc))
+                    time.sleep(DEFAULT_RETRY.delay(min(failures, DEFAULT_RETRY.attempts)))
+                    continue
+
+                if pending_ids:
+                    dispatched_this_pass += len(pending_ids)
+                    seq = self.checkpoint.dispatched(pending_ids[-1]) if self.checkpoint is not None else 0
+                    with self._outstanding_lock:
+                        self._outstanding += 1
+                    if not self._put((seq, pending_ids)):
+                        return
+                    continue
+
+                full_pass = self.cursor.start_after == ""
+                log("meili:pass:end", "dispatched", dispatched_this_pass, "full_pass", full_pass)
+                if full_pass and dispatched_this_pass == 0:
+                    break
+
+                # Rows behind the cursor may have changed meanwhile: let this pass
+                # finish loading, then sweep again from the first id.
+                while not self._stop.is_set():
+                    with self._outstanding_lock:
+                        if self._outstanding == 0:
+                            break
+                    time.sleep(PENDING_POLL_SECONDS)
+                self.cursor.restart()
+                if self.checkpoint is not None:
+                    self.checkpoint.reset()
+                dispatched_this_pass = 0
+                log("meili:pass:start", "after", repr(self.cursor.last_id))
+        except BaseException as exc:
+            traceback.print_exc()
+            self._prefetch_error = exc
+        finally:
+            self._stop.set()
+
+    def _load_batch(self, batch_num: int, seq: int, pending_ids: list[str]) -> None:
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    with self.pool.connection() as conn:
+                        self.step_load(
+                            conn,
+                            meili_host=self.meili_host,
+                            meili_key=self.meili_key,
+                            parsed_job_ids=pending_ids,
+                            removed_job_ids=[],
+                            meili_batch_size=self.batch_size,
+                        )
+                    break
+                except Exception as exc:
+                    log(f"meili:batch:{batch_num}:retry", attempt, "error", repr(exc))
+                    if attempt >= DEFAULT_RETRY.attempts:
+                        raise
+                    time.sleep(DEFAULT_RETRY.delay(attempt))
+        finally:
+            with self._outstanding_lock:
+                self._outstanding -= 1
+
+        if self.checkpoint is not None:
+            self.checkpoint.completed(seq)
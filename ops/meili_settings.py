@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+import requests
+
+
+TASK_POLL_SECONDS = 0.5
+TASK_TIMEOUT_SECONDS = 30 * 60
+
+# Settings Meilisearch treats as sets; GET returns them in its own order.
+ORDERLESS_SETTINGS = {
+    "filterableAttributes",
+    "sortableAttributes",
+    "stopWords",
+    "separatorTokens",
+    "nonSeparatorTokens",
+    "dictionary",
+}
+# Object settings a PATCH replaces wholesale rather than merging into.
+REPLACED_SETTINGS = {"synonyms"}
+
+
+def _matches(current: Any, desired: Any, orderless: bool = False) -> bool:
+    """True when ``current`` already has everything ``desired`` asks for.
+
+    Objects match when every desired field matches, so server-filled defaults
+    (and masked API keys) on the current side don't register as changes.
+    """
+    if isinstance(desired, dict):
+        return isinstance(current, dict) and all(_matches(current.get(key), value) for key, value in desired.items())
+    if orderless and isinstance(desired, list) and isinstance(current, list):
+        return sorted(desired, key=json.dumps) == sorted(current, key=json.dumps)
+    return current == desired
+
+
+def diff_settings(current: dict[str, Any], desired: dict[str, Any]) -> dict[str, Any]:
+    """Minimal settings PATCH body that turns ``current`` into ``desired``.
+
+    Only keys present in ``desired`` are managed. Under ``embedders`` the spec is
+    complete: changed embedders are sent in full and embedders missing from the
+    spec are removed.
+    """
+    changes: dict[str, Any] = {}
+    for key, value in desired.items():
+        if key == "embedders":
+            embedders = _embedders_diff(current.get(key) or {}, value or {})
+            if embedders:
+                changes[key] = embedders
+        elif key in REPLACED_SETTINGS:
+            if current.get(key) != value:
+                changes[key] = value
+        elif not _matches(current.get(key), value, orderless=key in ORDERLESS_SETTINGS):
+            changes[key] = value
+    return changes
+
+
+def _embedders_diff(current: dict[str, Any], desired: dict[str, Any]) -> dict[str, Any]:
+    changes = {name: config for name, config in desired.items() if not _matches(current.get(name), config)}
+    changes.update({name: None for name in current if name not in desired})
+    return changes
+
+
+class MeiliSettings:
+    """Declarative settings for one index: fetch, diff, and apply only what changed.
+
+    Every settings task can make Meilisearch re-process the whole index, so an
+    up-to-date index gets no task at all and a stale one gets a single PATCH.
+    """
+
+    def __init__(self, meili_host: str, index_uid: str, api_key: str = "") -> None:
+        self.meili_host = meili_host.rstrip("/")
+        self.index_uid = index_uid
+        self.headers = {
+            "Content-Type": "application/json",
+            **({"Authorization": f"Bearer {api_key}"} if api_key else {}),
+        }
+
+    @property
+    def url(self) -> str:
+        return f"{self.meili_host}/indexes/{self.index_uid}/settings"
+
+    def fetch(self) -> dict[str, Any]:
+        resp = requests.get(self.url, headers=self.headers, timeout=30)
+        if resp.status_code == 404:
+            # The index doesn't exist yet; the PATCH will create it.
+            return {}
+        resp.raise_for_status()
+        return resp.json()
+
+    def apply(self, desired: dict[str, Any], dry_run: bool = False) -> dict[str, Any]:
+        """Apply the changed part of ``desired`` and return it (empty when up to date)."""
+        current = self.fetch()
+        changes = diff_settings(current, desired)
+        if not changes:
+            print(f"Settings for {self.index_uid} are up to date")
+            return changes
+        print(f"Settings changes for {self.index_uid}{' (dry run)' if dry_run else ''}:")
+        print(json.dumps(changes, indent=2))
+        if dry_run:
+            return changes
+
+        # Meilisearch refuses to PATCH an embedder into a different source; drop it first.
+        current_embedders = current.get("embedders") or {}
+        resets = {
+            name: None
+            for name, config in (changes.get("embedders") or {}).items()
+            if config is not None
+            and name in current_embedders
+            and config.get("source") != current_embedders[name].get("source")
+        }
+        if resets:
+            self._patch({"embedders": resets})
+        self._patch(changes)
+        return changes
+
+    def _patch(self, body: dict[str, Any]) -> dict:
+        resp = requests.patch(self.url, headers=self.headers, data=json.dumps(body), timeout=120)
+        if not resp.ok:
+            raise RuntimeError(f"settings update for {self.index_uid} failed: {resp.status_code} {resp.text}")
+        return self.wait_for_task(resp.json()["taskUid"])
+
+    def wait_for_task(self, task_uid: int) -> dict:
+        deadline = time.monotonic() + TASK_TIMEOUT_SECONDS
+        while True:
+            resp = requests.get(f"{self.meili_host}/tasks/{task_uid}", headers=self.headers, timeout=30)
+            resp.raise_for_status()
+            task = resp.json()
+            status = task.get("status")
+            if status == "succeeded":
+                return task
+            if status in {"failed", "canceled"}:
+                raise RuntimeError(f"Meilisearch task {task_uid} {status}: {task.get('error')}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Meilisearch task {task_uid} still {status}")
+            time.sleep(TASK_POLL_SECONDS)
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import traceback
+from pathlib import Path
+
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from doc_version import (
+    DOC_VERSION_MIGRATION,
+    EXPECTED_DOC_VERSION_SQL,
+    PENDING_INDEX_NAME,
+    REMOVED_PENDING_INDEX_NAME,
+    REMOVED_PENDING_SQL,
+    REMOVED_TRACKING_MIGRATION,
+    STORED_PENDING_SQL,
+    doc_version_column_ready,
+)
+from pg_pool import log
+
+
+DOPEJOBS_ROOT = Path("/Users/aburkard/fun/dopejobs")
+PIPELINE_ROOT = Path("/Users/aburkard/fun/dope-jobs-pipeline")
+ENV_PATH = DOPEJOBS_ROOT / ".env"
+BACKFILL_BATCH_SIZE = 5000
+JOB_GROUP_DIRTY_MIGRATION = "job_group_dirty_boards"
+
+
+def ensure_migrations_table(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ops_schema_migrations (
+                name TEXT PRIMARY KEY,
+                detail TEXT,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+    conn.commit()
+
+
+def record_migration(conn, name: str, detail: str | None) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO ops_schema_migrations (name, detail, applied_at)
+            VALUES (%s, %s, now())
+            ON CONFLICT (name) DO UPDATE SET detail = EXCLUDED.detail, applied_at = EXCLUDED.applied_at
+            """,
+            (name, detail),
+        )
+    conn.commit()
+
+
+def install_doc_version_trigger(conn, schema_version: str) -> None:
+    # The schema version is baked into the trigger; re-running after a version bump
+    # replaces the function and the backfill below restamps every row.
+    new_row_version = (
+        EXPECTED_DOC_VERSION_SQL
+        .replace("content_hash", "NEW.content_hash")
+        .replace("last_parsed_at", "NEW.last_parsed_at")
+        .replace("job_group, id", "NEW.job_group, NEW.id")
+        .replace("%s", "{schema_version}")
+    )
+    with conn.cursor() as cur:
+        cur.execute("ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS meili_doc_version TEXT")
+        cur.execute(
+            sql.SQL(
+                """
+                CREATE OR REPLACE FUNCTION pipeline_jobs_set_meili_doc_version() RETURNS trigger
+                LANGUAGE plpgsql AS $fn$
+                BEGIN
+                    NEW.meili_doc_version := """
+                + new_row_version
+                + """;
+                    RETURN NEW;
+                END
+                $fn$
+                """
+            ).format(schema_version=sql.Literal(schema_version))
+        )
+        cur.execute("DROP TRIGGER IF EXISTS pipeline_jobs_meili_doc_version ON pipeline_jobs")
+        cur.execute(
+            """
+            CREATE TRIGGER pipeline_jobs_meili_doc_version
+            BEFORE INSERT OR UPDATE OF id, content_hash, last_parsed_at, job_group ON pipeline_jobs
+            FOR EACH ROW EXECUTE FUNCTION pipeline_jobs_set_meili_doc_version()
+            """
+        )
+    conn.commit()
+
+
+def backfill_doc_version(conn, schema_version: str, batch_size: int) -> int:
+    last_id = ""
+    updated = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id FROM pipeline_jobs WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size),
+            )
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                conn.commit()
+                break
+            cur.execute(
+                f"""
+                UPDATE pipeline_jobs
+                SET meili_doc_version = {EXPECTED_DOC_VERSION_SQL}
+                WHERE id = ANY(%s)
+                  AND meili_doc_version IS DISTINCT FROM {EXPECTED_DOC_VERSION_SQL}
+                """,
+                (schema_version, ids, schema_version),
+            )
+            updated += cur.rowcount
+        conn.commit()
+        last_id = ids[-1]
+        log("doc_version:backfill", "through", last_id, "updated", updated)
+    return updated
+
+
+def create_index_concurrently(conn, statement: str) -> None:
+    previous_autocommit = conn.autocommit
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(statement)
+    finally:
+        conn.autocommit = previous_autocommit
+
+
+def create_pending_index(conn) -> None:
+    create_index_concurrently(
+        conn,
+        f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {PENDING_INDEX_NAME}
+        ON pipeline_jobs (id)
+        WHERE removed_at IS NULL
+          AND raw_json IS NOT NULL
+          AND {STORED_PENDING_SQL}
+        """,
+    )
+
+
+def migrate_doc_version(conn, schema_version: str, batch_size: int) -> None:
+    ensure_migrations_table(conn)
+    if doc_version_column_ready(conn, schema_version):
+        log("doc_version:up_to_date", "schema_version", schema_version)
+        return
+    install_doc_version_trigger(conn, schema_version)
+    log("doc_version:trigger_installed", "schema_version", schema_version)
+    updated = backfill_doc_version(conn, schema_version, batch_size)
+    log("doc_version:backfilled", "updated", updated)
+    create_pending_index(conn)
+    log("doc_version:index_ready", PENDING_INDEX_NAME)
+    # Only now do readers switch from the md5 expression to the stored column.
+    record_migration(conn, DOC_VERSION_MIGRATION, schema_version)
+
+
+def migration_applied(conn, name: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM ops_schema_migrations WHERE name = %s", (name,))
+        applied = cur.fetchone() is not None
+    conn.commit()
+    return applied
+
+
+def migrate_job_group_dirty_boards(conn) -> None:
+    ensure_migrations_table(conn)
+    if migration_applied(conn, JOB_GROUP_DIRTY_MIGRATION):
+        log("job_group_dirty:up_to_date")
+        return
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_group_dirty_boards (
+                ats TEXT NOT NULL,
+                board_token TEXT NOT NULL,
+                marked_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                claimed_by TEXT,
+                PRIMARY KEY (ats, board_token)
+            )
+            """
+        )
+        cur.execute(
+            """
+            -- Re-marking clears any claim, so a change made while a group pass is
+            -- running survives that pass's cleanup.
+            CREATE OR REPLACE FUNCTION pipeline_jobs_mark_job_group_dirty() RETURNS trigger
+            LANGUAGE plpgsql AS $fn$
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    INSERT INTO job_group_dirty_boards (ats, board_token, marked_at)
+                    VALUES (OLD.ats, OLD.board_token, now())
+                    ON CONFLICT (ats, board_token)
+                    DO UPDATE SET marked_at = EXCLUDED.marked_at, claimed_by = NULL;
+                END IF;
+                IF TG_OP = 'INSERT'
+                   OR (TG_OP = 'UPDATE' AND (OLD.ats, OLD.board_token) IS DISTINCT FROM (NEW.ats, NEW.board_token)) THEN
+                    INSERT INTO job_group_dirty_boards (ats, board_token, marked_at)
+                    VALUES (NEW.ats, NEW.board_token, now())
+                    ON CONFLICT (ats, board_token)
+                    DO UPDATE SET marked_at = EXCLUDED.marked_at, claimed_by = NULL;
+                END IF;
+                RETURN NULL;
+            END
+            $fn$
+            """
+        )
+        cur.execute("DROP TRIGGER IF EXISTS pipeline_jobs_job_group_dirty_insert_delete ON pipeline_jobs")
+        cur.execute(
+            """
+            CREATE TRIGGER pipeline_jobs_job_group_dirty_insert_delete
+            AFTER INSERT OR DELETE ON pipeline_jobs
+            FOR EACH ROW EXECUTE FUNCTION pipeline_jobs_mark_job_group_dirty()
+            """
+        )
+        # Only changes that can alter grouping: titles, removals, raw presence, board moves.
+        cur.execute("DROP TRIGGER IF EXISTS pipeline_jobs_job_group_dirty_update ON pipeline_jobs")
+        cur.execute(
+            """
+            CREATE TRIGGER pipeline_jobs_job_group_dirty_update
+            AFTER UPDATE OF title, removed_at, raw_json, ats, board_token ON pipeline_jobs
+            FOR EACH ROW
+            WHEN (
+                OLD.title IS DISTINCT FROM NEW.title
+                OR OLD.removed_at IS DISTINCT FROM NEW.removed_at
+                OR (OLD.raw_json IS NULL) IS DISTINCT FROM (NEW.raw_json IS NULL)
+                OR OLD.ats IS DISTINCT FROM NEW.ats
+                OR OLD.board_token IS DISTINCT FROM NEW.board_token
+            )
+            EXECUTE FUNCTION pipeline_jobs_mark_job_group_dirty()
+            """
+        )
+        # Nothing is known about changes before tracking started, so the first
+        # incremental pass covers every board.
+        cur.execute(
+            """
+            INSERT INTO job_group_dirty_boards (ats, board_token)
+            SELECT DISTINCT ats, board_token
+            FROM pipeline_jobs
+            ON CONFLICT (ats, board_token) DO NOTHING
+            """
+        )
+    conn.commit()
+    record_migration(conn, JOB_GROUP_DIRTY_MIGRATION, None)
+    log("job_group_dirty:installed")
+
+
+def migrate_removed_tracking(conn) -> None:
+    ensure_migrations_table(conn)
+    if migration_applied(conn, REMOVED_TRACKING_MIGRATION):
+        log("meili_removed:up_to_date")
+        return
+    with conn.cursor() as cur:
+        cur.execute("ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS meili_removed_at TIMESTAMPTZ")
+    conn.commit()
+    # No backfill: nothing says which removed rows are already gone from the index,
+    # so the first delete pass covers the historical removed set once.
+    create_index_concurrently(
+        conn,
+        f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {REMOVED_PENDING_INDEX_NAME}
+        ON pipeline_jobs (id)
+        WHERE {REMOVED_PENDING_SQL}
+        """,
+    )
+    record_migration(conn, REMOVED_TRACKING_MIGRATION, None)
+    log("meili_removed:installed", REMOVED_PENDING_INDEX_NAME)
+
+
+def status(conn, schema_version: str) -> None:
+    ready = doc_version_column_ready(conn, schema_version)
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (PENDING_INDEX_NAME,))
+        index_exists = cur.fetchone()[0]
+        stale = None
+        if ready:
+            cur.execute(
+                f"""
+                SELECT COUNT(*)
+                FROM pipeline_jobs
+                WHERE meili_doc_version IS DISTINCT FROM {EXPECTED_DOC_VERSION_SQL}
+                """,
+                (schema_version,),
+            )
+            stale = cur.fetchone()[0]
+    conn.commit()
+    log(
+        "doc_version:status",
+        {
+            "schema_version": schema_version,
+            "column_ready": ready,
+            "pending_index": index_exists,
+            "stale_rows": stale,
+        },
+    )
+    if migration_applied(conn, JOB_GROUP_DIRTY_MIGRATION):
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*), MIN(marked_at) FROM job_group_dirty_boards")
+            dirty_boards, oldest = cur.fetchone()
+        conn.commit()
+        log("job_group_dirty:status", {"dirty_boards": dirty_boards, "oldest_mark": oldest and oldest.isoformat()})
+    if migration_applied(conn, REMOVED_TRACKING_MIGRATION):
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM pipeline_jobs WHERE {REMOVED_PENDING_SQL}")
+            pending_deletes = cur.fetchone()[0]
+        conn.commit()
+        log("meili_removed:status", {"pending_deletes": pending_deletes})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Schema changes the ops tooling relies on.")
+    parser.add_argument("command", choices=["apply", "backfill", "status"], nargs="?", default="apply")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    load_dotenv(ENV_PATH)
+    sys.path.insert(0, str(PIPELINE_ROOT))
+
+    from db import MEILI_DOC_SCHEMA_VERSION, get_connection
+
+    conn = get_connection()
+    try:
+        ensure_migrations_table(conn)
+        if args.command == "apply":
+            migrate_doc_version(conn, MEILI_DOC_SCHEMA_VERSION, args.batch_size)
+            migrate_job_group_dirty_boards(conn)
+            migrate_removed_tracking(conn)
+        elif args.command == "backfill":
+            updated = backfill_doc_version(conn, MEILI_DOC_SCHEMA_VERSION, args.batch_size)
+            log("doc_version:backfilled", "updated", updated)
+        status(conn, MEILI_DOC_SCHEMA_VERSION)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except SystemExit:
+        raise
+    except Exception:
+        traceback.print_exc()
+        raise
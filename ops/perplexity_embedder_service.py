@@ -1,30 +1,146 @@
+import asyncio
+import base64
+import functools
+import importlib.util
 import json
 import os
-from contextlib import asynccontextmanager
-from typing import Any
+import random
+import time
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Awaitable, Callable
 
 import httpx
 import numpy as np
 from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from embedder_metrics import FAST_BUCKETS, SIZE_BUCKETS, Registry
+from embedding_cache import EmbeddingCache, cache_key, normalize_text
+from index_embedding_cache import IndexEmbeddingStore
+from local_embedder import LocalEmbedder
+from upstream_failover import UpstreamHealth, UpstreamsFailed, hedged
+from vector_quantization import QUANTIZE_MODES, quantize
+
 
 MODEL_ID = os.environ.get("PPLX_MODEL_ID", "perplexity/pplx-embed-v1-0.6b")
 SEARCH_UPSTREAM_URL = os.environ.get("PPLX_SEARCH_UPSTREAM_URL", "http://127.0.0.1:8088/embed")
+# Tried in order; the first is the primary whose latency sets the hedge delay.
+SEARCH_UPSTREAM_URLS = [
+    url.strip()
+    for url in os.environ.get("PPLX_SEARCH_UPSTREAM_URLS", SEARCH_UPSTREAM_URL).split(",")
+    if url.strip()
+]
 OPENROUTER_URL = os.environ.get("PPLX_OPENROUTER_URL", "https://openrouter.ai/api/v1/embeddings")
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
 EMBED_DIM = int(os.environ.get("PPLX_EMBED_DIM", "512"))
 NORMALIZE = os.environ.get("PPLX_NORMALIZE", "true").lower() not in {"0", "false", "no"}
+# Applied to responses only; caches keep full-precision rows so the mode can change freely.
+QUANTIZE = os.environ.get("PPLX_QUANTIZE", "none").lower()
+if QUANTIZE not in QUANTIZE_MODES:
+    raise RuntimeError(f"PPLX_QUANTIZE must be one of {QUANTIZE_MODES}, got {QUANTIZE!r}")
 HTTP_TIMEOUT = float(os.environ.get("PPLX_TIMEOUT_SECONDS", "30"))
+# Search (TEI) and index (OpenRouter) traffic get separate pools so an indexing burst
+# can't leave query embeddings waiting for a connection.
+SEARCH_MAX_CONNECTIONS = max(1, int(os.environ.get("PPLX_SEARCH_MAX_CONNECTIONS", "64")))
+SEARCH_MAX_KEEPALIVE = max(0, int(os.environ.get("PPLX_SEARCH_MAX_KEEPALIVE", "32")))
+INDEX_MAX_CONNECTIONS = max(1, int(os.environ.get("PPLX_INDEX_MAX_CONNECTIONS", "16")))
+INDEX_MAX_KEEPALIVE = max(0, int(os.environ.get("PPLX_INDEX_MAX_KEEPALIVE", "16")))
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("PPLX_KEEPALIVE_EXPIRY_SECONDS", "60"))
+POOL_TIMEOUT_SECONDS = float(os.environ.get("PPLX_POOL_TIMEOUT_SECONDS", "10"))
+OPENROUTER_HTTP2 = os.environ.get("PPLX_OPENROUTER_HTTP2", "true").lower() not in {"0", "false", "no"}
 STARTUP_RETRIES = int(os.environ.get("PPLX_STARTUP_RETRIES", "20"))
 STARTUP_RETRY_SECONDS = float(os.environ.get("PPLX_STARTUP_RETRY_SECONDS", "1"))
-SEARCH_UPSTREAM_BATCH_SIZE = max(1, int(os.environ.get("PPLX_SEARCH_UPSTREAM_BATCH_SIZE", "1")))
+# "tei" calls SEARCH_UPSTREAM_URLS; "local" runs the model in this process.
+SEARCH_BACKEND = os.environ.get("PPLX_SEARCH_BACKEND", "tei").lower()
+LOCAL_MODEL_ID = os.environ.get("PPLX_LOCAL_MODEL_ID", "perplexity-ai/pplx-embed-v1-0.6B")
+LOCAL_RUNTIME = os.environ.get("PPLX_LOCAL_RUNTIME", "torch").lower()
+LOCAL_DEVICE = os.environ.get("PPLX_LOCAL_DEVICE", "cpu")
+LOCAL_WORKERS = max(1, int(os.environ.get("PPLX_LOCAL_WORKERS", "1")))
+LOCAL_INTRA_OP_THREADS = int(os.environ.get("PPLX_LOCAL_INTRA_OP_THREADS", "0"))
+LOCAL_PROMPT = os.environ.get("PPLX_LOCAL_PROMPT", "")
+SEARCH_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get("PPLX_SEARCH_ATTEMPT_TIMEOUT_SECONDS", "5"))
+SEARCH_HEDGE = os.environ.get("PPLX_SEARCH_HEDGE", "true").lower() not in {"0", "false", "no"}
+SEARCH_HEDGE_MIN_MS = float(os.environ.get("PPLX_SEARCH_HEDGE_MIN_MS", "20"))
+SEARCH_HEDGE_MAX_MS = float(os.environ.get("PPLX_SEARCH_HEDGE_MAX_MS", "500"))
+SEARCH_OPENROUTER_FALLBACK = os.environ.get("PPLX_SEARCH_OPENROUTER_FALLBACK", "true").lower() not in {
+    "0",
+    "false",
+    "no",
+}
+CIRCUIT_FAILURES = int(os.environ.get("PPLX_CIRCUIT_FAILURES", "3"))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("PPLX_CIRCUIT_OPEN_SECONDS", "10"))
+SEARCH_UPSTREAM_BATCH_SIZE = max(1, int(os.environ.get("PPLX_SEARCH_UPSTREAM_BATCH_SIZE", "32")))
+SEARCH_BATCH_WINDOW_MS = max(0.0, float(os.environ.get("PPLX_SEARCH_BATCH_WINDOW_MS", "5")))
+SEARCH_BATCH_MAX_TOKENS = max(1, int(os.environ.get("PPLX_SEARCH_BATCH_MAX_TOKENS", "2048")))
+SEARCH_CACHE_MAX_MB = max(0.0, float(os.environ.get("PPLX_SEARCH_CACHE_MAX_MB", "64")))
+SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("PPLX_SEARCH_CACHE_TTL_SECONDS", "86400"))
+SEARCH_CACHE_DISK_PATH = os.environ.get("PPLX_SEARCH_CACHE_DISK_PATH", "")
+SEARCH_CACHE_DISK_MAX_ENTRIES = max(0, int(os.environ.get("PPLX_SEARCH_CACHE_DISK_MAX_ENTRIES", "200000")))
+INDEX_CACHE_PATH = os.environ.get("PPLX_INDEX_CACHE_PATH", "")
 INDEX_UPSTREAM_BATCH_SIZE = max(1, min(10, int(os.environ.get("PPLX_INDEX_UPSTREAM_BATCH_SIZE", "10"))))
+INDEX_UPSTREAM_CONCURRENCY = max(1, int(os.environ.get("PPLX_INDEX_UPSTREAM_CONCURRENCY", "4")))
+INDEX_UPSTREAM_RETRIES = max(0, int(os.environ.get("PPLX_INDEX_UPSTREAM_RETRIES", "4")))
+INDEX_RETRY_BASE_SECONDS = float(os.environ.get("PPLX_INDEX_RETRY_BASE_SECONDS", "0.5"))
+INDEX_RETRY_MAX_SECONDS = float(os.environ.get("PPLX_INDEX_RETRY_MAX_SECONDS", "8"))
 OPENROUTER_ENCODING_FORMAT = os.environ.get("PPLX_OPENROUTER_ENCODING_FORMAT", "float")
 OPENROUTER_HTTP_REFERER = os.environ.get("PPLX_OPENROUTER_HTTP_REFERER", "")
 OPENROUTER_X_TITLE = os.environ.get("PPLX_OPENROUTER_X_TITLE", "")
 
-CLIENT: httpx.AsyncClient | None = None
+SEARCH_CLIENT: httpx.AsyncClient | None = None
+INDEX_CLIENT: httpx.AsyncClient | None = None
+SEARCH_BATCHER: "SearchBatcher | None" = None
+SEARCH_CACHE: EmbeddingCache | None = None
+INDEX_CACHE: IndexEmbeddingStore | None = None
+LOCAL_EMBEDDER: LocalEmbedder | None = None
+SearchCall = Callable[[httpx.AsyncClient, list[str]], Awaitable[np.ndarray]]
+SEARCH_TARGETS: list[tuple[UpstreamHealth, SearchCall]] = []
+SEARCH_FALLBACK: tuple[UpstreamHealth, SearchCall] | None = None
+# Shared across requests so concurrent Meilisearch batches respect one OpenRouter budget.
+INDEX_SEMAPHORE: asyncio.Semaphore | None = None
+
+EMBED_ROUTES = {
+    "/search-embed",
+    "/embed",
+    "/index-embed",
+    "/openai-search/v1/embeddings",
+    "/openai-index/v1/embeddings",
+}
+METRICS = Registry()
+REQUESTS = METRICS.counter("pplx_embedder_requests_total", "Embedding requests by route and status.", ("route", "status"))
+REQUEST_SECONDS = METRICS.histogram(
+    "pplx_embedder_request_seconds", "End-to-end embedding request latency.", ("route",)
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge("pplx_embedder_requests_in_flight", "Embedding requests being served.", ("route",))
+INPUTS = METRICS.counter("pplx_embedder_inputs_total", "Inputs received by route.", ("route",))
+REQUEST_INPUTS = METRICS.histogram(
+    "pplx_embedder_request_inputs", "Inputs per embedding request.", ("route",), buckets=SIZE_BUCKETS
+)
+UPSTREAM_REQUESTS = METRICS.counter(
+    "pplx_embedder_upstream_requests_total",
+    "Upstream embedding calls by upstream and status (HTTP code, transport_error, or ok/error for the local backend).",
+    ("upstream", "status"),
+)
+UPSTREAM_SECONDS = METRICS.histogram(
+    "pplx_embedder_upstream_seconds", "Upstream embedding call latency.", ("upstream",)
+)
+UPSTREAM_BATCH_INPUTS = METRICS.histogram(
+    "pplx_embedder_upstream_batch_inputs", "Inputs per upstream call.", ("upstream",), buckets=SIZE_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = METRICS.gauge("pplx_embedder_upstream_in_flight", "Upstream calls in progress.", ("upstream",))
+SEARCH_EXTRA_ATTEMPTS = METRICS.counter(
+    "pplx_embedder_search_extra_attempts_total",
+    "Search attempts beyond the first, by reason (hedge/failover) and upstream.",
+    ("reason", "upstream"),
+)
+POST_PROCESS_SECONDS = METRICS.histogram(
+    "pplx_embedder_post_process_seconds", "Time spent truncating and normalizing vectors.", buckets=FAST_BUCKETS
+)
 
 
 class EmbedRequest(BaseModel):
@@ -48,7 +164,22 @@ class OpenAIEmbedRequest(BaseModel):
     encoding_format: str | None = None
 
 
+def _loads(content: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _decode_embedding(value: Any) -> np.ndarray:
+    # base64 payloads are little-endian float32 buffers; decode without a float list.
+    # Providers that ignore encoding_format send floats either way, so accept both.
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype="<f4")
+    return np.asarray(value, dtype=np.float32)
+
+
 def _post_process_embeddings(raw: Any) -> np.ndarray:
+    start = time.perf_counter()
     vectors = np.asarray(raw, dtype=np.float32)
     if vectors.ndim == 1:
         vectors = vectors.reshape(1, -1)
@@ -65,32 +196,178 @@ def _post_process_embeddings(raw: Any) -> np.ndarray:
         norms = np.linalg.norm(vectors, axis=1)
         np.maximum(norms, 1e-12, out=norms)
         vectors /= norms[:, None]
+    POST_PROCESS_SECONDS.observe(time.perf_counter() - start)
     return vectors
 
 
+def _build_client(max_connections: int, max_keepalive: int, http2: bool) -> httpx.AsyncClient:
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("h2 is not installed; falling back to HTTP/1.1 (pip install 'httpx[http2]')", flush=True)
+        http2 = False
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, pool=POOL_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        http2=http2,
+    )
+
+
+# Requests between entering and leaving _upstream_post, per pool; counted here so the
+# numbers survive httpcore internals changing. Only touched from the event loop.
+POOL_REQUESTS = {"search": 0, "index": 0}
+
+
+def _pool_name(client: httpx.AsyncClient) -> str:
+    return "search" if client is SEARCH_CLIENT else "index"
+
+
+def _httpcore_pool_stats(client: httpx.AsyncClient) -> dict[str, int] | None:
+    # httpx has no public pool API; read httpcore's pool the way its own __repr__ does.
+    # Best effort: any change to those internals just drops these numbers.
+    try:
+        pool = client._transport._pool
+        connections = list(pool.connections)
+        queued = [request.is_queued() for request in list(pool._requests)]
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+            "http2_connections": sum(1 for conn in connections if "HTTP/2" in repr(conn)),
+            "active_requests": queued.count(False),
+            "queued_requests": queued.count(True),
+        }
+    except Exception:
+        return None
+
+
+def _pool_stats(name: str, client: httpx.AsyncClient | None) -> dict[str, int] | None:
+    if client is None:
+        return None
+    return {"requests_in_flight": POOL_REQUESTS[name], **(_httpcore_pool_stats(client) or {})}
+
+
+async def _upstream_post(upstream: str, client: httpx.AsyncClient, url: str, inputs: int, **kwargs) -> httpx.Response:
+    UPSTREAM_BATCH_INPUTS.observe(inputs, upstream=upstream)
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    pool = _pool_name(client)
+    POOL_REQUESTS[pool] += 1
+    status = "transport_error"
+    start = time.perf_counter()
+    try:
+        resp = await client.post(url, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    except asyncio.CancelledError:
+        # A hedge loser being cancelled, not an upstream failure.
+        status = "cancelled"
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=upstream)
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+        POOL_REQUESTS[pool] -= 1
+        UPSTREAM_REQUESTS.inc(upstream=upstream, status=status)
+
+
 async def _warm_up_upstream(client: httpx.AsyncClient) -> None:
+    # Ready once any primary target answers; the fallback doesn't count.
     last_error: Exception | None = None
     for _ in range(STARTUP_RETRIES):
-        try:
-            warmup = await client.post(SEARCH_UPSTREAM_URL, json={"inputs": ["warmup"]})
-            warmup.raise_for_status()
-            _post_process_embeddings(warmup.json())
-            return
-        except (httpx.HTTPError, ValueError) as exc:
-            last_error = exc
-            import asyncio
-
-            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+        for _, call in SEARCH_TARGETS:
+            try:
+                await call(client, ["warmup"])
+                return
+            except (httpx.HTTPError, ValueError) as exc:
+                last_error = exc
+        await asyncio.sleep(STARTUP_RETRY_SECONDS)
     raise RuntimeError(f"failed to warm upstream embedder after retries: {last_error}") from last_error
 
 
+async def _local_search_batch(_: httpx.AsyncClient, batch: list[str]) -> np.ndarray:
+    UPSTREAM_BATCH_INPUTS.observe(len(batch), upstream="search_local")
+    UPSTREAM_IN_FLIGHT.inc(upstream="search_local")
+    status = "error"
+    start = time.perf_counter()
+    try:
+        raw = await LOCAL_EMBEDDER.embed(batch)
+        status = "ok"
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream="search_local")
+        UPSTREAM_IN_FLIGHT.dec(upstream="search_local")
+        UPSTREAM_REQUESTS.inc(upstream="search_local", status=status)
+    return _post_process_embeddings(raw)
+
+
+async def _tei_search_batch(url: str, client: httpx.AsyncClient, batch: list[str]) -> np.ndarray:
+    resp = await _upstream_post("search_tei", client, url, len(batch), json={"inputs": batch})
+    resp.raise_for_status()
+    return _post_process_embeddings(_loads(resp.content))
+
+
+def _search_hedge_delay(primary: UpstreamHealth) -> float | None:
+    if not SEARCH_HEDGE:
+        return None
+    p95 = primary.percentile(0.95)
+    delay_ms = SEARCH_HEDGE_MAX_MS if p95 is None else min(SEARCH_HEDGE_MAX_MS, max(SEARCH_HEDGE_MIN_MS, p95 * 1000))
+    return delay_ms / 1000
+
+
+async def _openrouter_search_batch(_: httpx.AsyncClient, batch: list[str]) -> np.ndarray:
+    # OpenRouter goes through the index pool, which is the one set up for it, but not
+    # through INDEX_SEMAPHORE: a search failover shouldn't queue behind indexing.
+    return await _fetch_index_embeddings(INDEX_CLIENT, batch, for_search=True)
+
+
+def _count_extra_attempt(reason: str, upstream: str) -> None:
+    SEARCH_EXTRA_ATTEMPTS.inc(reason=reason, upstream=upstream)
+
+
+async def _post_search_batch(client: httpx.AsyncClient, batch: list[str]) -> np.ndarray:
+    primaries = [target for target in SEARCH_TARGETS if target[0].available()]
+    if not primaries and SEARCH_FALLBACK is None:
+        # Every circuit is open and there's nowhere else to go: try them anyway.
+        primaries = list(SEARCH_TARGETS)
+    errors: list[BaseException] = []
+    vectors = None
+    if primaries:
+        # Hedging stays among the primaries; a slow search never buys a paid OpenRouter call.
+        try:
+            vectors = await hedged(
+                [(health, functools.partial(call, client, batch)) for health, call in primaries],
+                hedge_delay=_search_hedge_delay(primaries[0][0]),
+                attempt_timeout=SEARCH_ATTEMPT_TIMEOUT_SECONDS,
+                on_extra_attempt=_count_extra_attempt,
+            )
+        except UpstreamsFailed as exc:
+            if SEARCH_FALLBACK is None:
+                raise
+            errors = exc.errors
+    if vectors is None:
+        # Only reached once every primary failed or had its circuit open.
+        health, call = SEARCH_FALLBACK
+        _count_extra_attempt("failover", health.name)
+        try:
+            vectors = await hedged(
+                [(health, functools.partial(call, client, batch))],
+                hedge_delay=None,
+                attempt_timeout=SEARCH_ATTEMPT_TIMEOUT_SECONDS,
+            )
+        except UpstreamsFailed as exc:
+            raise UpstreamsFailed(errors + exc.errors) from exc
+    if vectors.shape[0] != len(batch):
+        raise ValueError(f"upstream returned {vectors.shape[0]} embeddings for {len(batch)} inputs")
+    return vectors
+
+
 async def _fetch_search_embeddings(client: httpx.AsyncClient, inputs: list[str]) -> np.ndarray:
     chunks: list[np.ndarray] = []
     for start in range(0, len(inputs), SEARCH_UPSTREAM_BATCH_SIZE):
         batch = inputs[start:start + SEARCH_UPSTREAM_BATCH_SIZE]
-        resp = await client.post(SEARCH_UPSTREAM_URL, json={"inputs": batch})
-        resp.raise_for_status()
-        chunks.append(_post_process_embeddings(resp.json()))
+        chunks.append(await _post_search_batch(client, batch))
     if not chunks:
         return np.empty((0, EMBED_DIM), dtype=np.float32)
     if len(chunks) == 1:
@@ -98,6 +375,158 @@ async def _fetch_search_embeddings(client: httpx.AsyncClient, inputs: list[str])
     return np.vstack(chunks)
 
 
+def _estimate_tokens(text: str) -> int:
+    # Tokenizer-free upper-ish bound: ~4 chars per token plus special tokens.
+    return len(text) // 4 + 2
+
+
+class SearchBatcher:
+    """Coalesces concurrent search-embedding requests into shared upstream batches.
+
+    Requests arriving within ``window_seconds`` of the first queued one are sent
+    together as soon as the window closes, the batch reaches ``max_inputs`` inputs,
+    or the next request would push it past ``max_tokens`` estimated tokens. Each
+    caller gets back only its own rows. Requests too large to share a batch are
+    sent on their own.
+    """
+
+    def __init__(self, window_seconds: float, max_inputs: int, max_tokens: int) -> None:
+        self.window_seconds = window_seconds
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self._pending: list[tuple[list[str], asyncio.Future]] = []
+        self._pending_inputs = 0
+        self._pending_tokens = 0
+        self._client: httpx.AsyncClient | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+        self.inputs = 0
+
+    async def embed(self, client: httpx.AsyncClient, inputs: list[str]) -> np.ndarray:
+        tokens = sum(_estimate_tokens(text) for text in inputs)
+        if self.window_seconds <= 0 or len(inputs) >= self.max_inputs or tokens >= self.max_tokens:
+            return await _fetch_search_embeddings(client, inputs)
+
+        if (
+            self._pending_inputs + len(inputs) > self.max_inputs
+            or self._pending_tokens + tokens > self.max_tokens
+        ):
+            self._flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._client = client
+        self._pending.append((inputs, future))
+        self._pending_inputs += len(inputs)
+        self._pending_tokens += tokens
+        if self._pending_inputs >= self.max_inputs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+        return await future
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_inputs": self.max_inputs,
+            "max_tokens": self.max_tokens,
+            "batches": self.batches,
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "mean_inputs_per_batch": round(self.inputs / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._pending_inputs = 0
+        self._pending_tokens = 0
+        task = asyncio.get_running_loop().create_task(self._send(self._client, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(
+        self,
+        client: httpx.AsyncClient,
+        pending: list[tuple[list[str], asyncio.Future]],
+    ) -> None:
+        batch = [text for inputs, _ in pending for text in inputs]
+        try:
+            vectors = await _post_search_batch(client, batch)
+        except Exception as exc:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.requests += len(pending)
+        self.inputs += len(batch)
+        offset = 0
+        for inputs, future in pending:
+            rows = vectors[offset:offset + len(inputs)]
+            offset += len(inputs)
+            if not future.done():
+                future.set_result(rows)
+
+
+async def _cached_embeddings(
+    cache: Any,
+    keys: list[bytes],
+    texts: list[str],
+    fetch: Callable[[list[str]], Awaitable[np.ndarray]],
+    blocking: bool,
+) -> np.ndarray:
+    async def call(fn, *args):
+        # SQLite lookups and writes stay off the event loop; memory-only calls are cheap.
+        if blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    rows = await call(cache.get_many, keys)
+    missing: dict[bytes, str] = {}
+    for key, text, row in zip(keys, texts, rows):
+        if row is None:
+            missing.setdefault(key, text)
+    if missing:
+        vectors = await fetch(list(missing.values()))
+        await call(cache.put_many, list(missing), vectors)
+        fetched = dict(zip(missing, vectors))
+        rows = [row if row is not None else fetched[key] for key, row in zip(keys, rows)]
+    return np.vstack(rows)
+
+
+async def _search_embeddings(inputs: list[str]) -> np.ndarray:
+    if SEARCH_CACHE is None or not SEARCH_CACHE.enabled:
+        return await SEARCH_BATCHER.embed(SEARCH_CLIENT, inputs)
+    texts = [normalize_text(text) for text in inputs]
+    return await _cached_embeddings(
+        SEARCH_CACHE,
+        [cache_key(text, MODEL_ID, EMBED_DIM) for text in texts],
+        texts,
+        lambda batch: SEARCH_BATCHER.embed(SEARCH_CLIENT, batch),
+        blocking=SEARCH_CACHE.disk_path is not None,
+    )
+
+
+async def _index_embeddings(inputs: list[str]) -> np.ndarray:
+    if INDEX_CACHE is None:
+        return await _fetch_index_embeddings(INDEX_CLIENT, inputs)
+    # Rendered documents are hashed verbatim: any template or content change is a miss.
+    return await _cached_embeddings(
+        INDEX_CACHE,
+        [cache_key(text, MODEL_ID, EMBED_DIM) for text in inputs],
+        inputs,
+        lambda batch: _fetch_index_embeddings(INDEX_CLIENT, batch),
+        blocking=True,
+    )
+
+
 def _openrouter_headers() -> dict[str, str]:
     headers = {"Content-Type": "application/json"}
     if OPENROUTER_API_KEY:
@@ -109,27 +538,75 @@ def _openrouter_headers() -> dict[str, str]:
     return headers
 
 
-async def _fetch_index_embeddings(client: httpx.AsyncClient, inputs: list[str]) -> np.ndarray:
-    chunks: list[np.ndarray] = []
+def _retry_delay(attempt: int, resp: httpx.Response | None) -> float:
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(INDEX_RETRY_MAX_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    delay = min(INDEX_RETRY_MAX_SECONDS, INDEX_RETRY_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def _retryable(resp: httpx.Response) -> bool:
+    return resp.status_code == 429 or resp.status_code >= 500
+
+
+async def _post_index_chunk(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    batch: list[str],
+    for_search: bool = False,
+) -> np.ndarray:
+    payload: dict[str, Any] = {
+        "model": MODEL_ID,
+        "input": batch if len(batch) > 1 else batch[0],
+        "encoding_format": OPENROUTER_ENCODING_FORMAT,
+        "dimensions": EMBED_DIM,
+    }
+    # Search failovers skip the indexing semaphore and don't retry: the search attempt
+    # timeout bounds them, and backing off would only hold the caller longer.
+    upstream = "search_openrouter" if for_search else "index_openrouter"
+    retries = 0 if for_search else INDEX_UPSTREAM_RETRIES
+    attempt = 0
+    while True:
+        resp: httpx.Response | None = None
+        try:
+            async with nullcontext() if for_search else INDEX_SEMAPHORE:
+                resp = await _upstream_post(upstream, client, OPENROUTER_URL, len(batch), headers=headers, json=payload)
+            if not _retryable(resp):
+                resp.raise_for_status()
+                break
+            if attempt >= retries:
+                resp.raise_for_status()
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+        # Sleep outside the semaphore so a backing-off chunk doesn't hold a slot.
+        await asyncio.sleep(_retry_delay(attempt, resp))
+        attempt += 1
+
+    body = _loads(resp.content)
+    data = body.get("data")
+    if not isinstance(data, list):
+        raise ValueError("unexpected OpenRouter response shape: missing data array")
+    if len(data) != len(batch):
+        raise ValueError(f"OpenRouter returned {len(data)} embeddings for {len(batch)} inputs")
+    return _post_process_embeddings(np.vstack([_decode_embedding(item.get("embedding")) for item in data]))
+
+
+async def _fetch_index_embeddings(client: httpx.AsyncClient, inputs: list[str], for_search: bool = False) -> np.ndarray:
     headers = _openrouter_headers()
-    for start in range(0, len(inputs), INDEX_UPSTREAM_BATCH_SIZE):
-        batch = inputs[start:start + INDEX_UPSTREAM_BATCH_SIZE]
-        payload: dict[str, Any] = {
-            "model": MODEL_ID,
-            "input": batch if len(batch) > 1 else batch[0],
-            "encoding_format": OPENROUTER_ENCODING_FORMAT,
-            "dimensions": EMBED_DIM,
-        }
-        resp = await client.post(OPENROUTER_URL, headers=headers, json=payload)
-        resp.raise_for_status()
-        body = resp.json()
-        data = body.get("data")
-        if not isinstance(data, list):
-            raise ValueError("unexpected OpenRouter response shape: missing data array")
-        chunk = [item.get("embedding") for item in data]
-        chunks.append(_post_process_embeddings(chunk))
-    if not chunks:
+    batches = [
+        inputs[start:start + INDEX_UPSTREAM_BATCH_SIZE]
+        for start in range(0, len(inputs), INDEX_UPSTREAM_BATCH_SIZE)
+    ]
+    if not batches:
         return np.empty((0, EMBED_DIM), dtype=np.float32)
+    # gather keeps input order; index concurrency is bounded by INDEX_SEMAPHORE.
+    chunks = await asyncio.gather(*(_post_index_chunk(client, headers, batch, for_search) for batch in batches))
     if len(chunks) == 1:
         return chunks[0]
     return np.vstack(chunks)
@@ -137,29 +614,169 @@ async def _fetch_index_embeddings(client: httpx.AsyncClient, inputs: list[str])
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    global CLIENT
-    CLIENT = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
-    await _warm_up_upstream(CLIENT)
+    global SEARCH_CLIENT, INDEX_CLIENT, SEARCH_BATCHER, SEARCH_CACHE, INDEX_CACHE, INDEX_SEMAPHORE, LOCAL_EMBEDDER
+    global SEARCH_TARGETS, SEARCH_FALLBACK
+    # TEI is plain HTTP on loopback, where HTTP/2 would buy nothing.
+    SEARCH_CLIENT = _build_client(SEARCH_MAX_CONNECTIONS, SEARCH_MAX_KEEPALIVE, http2=False)
+    INDEX_CLIENT = _build_client(INDEX_MAX_CONNECTIONS, INDEX_MAX_KEEPALIVE, http2=OPENROUTER_HTTP2)
+    INDEX_SEMAPHORE = asyncio.Semaphore(INDEX_UPSTREAM_CONCURRENCY)
+    if SEARCH_BACKEND == "local":
+        LOCAL_EMBEDDER = LocalEmbedder(
+            LOCAL_MODEL_ID,
+            runtime=LOCAL_RUNTIME,
+            device=LOCAL_DEVICE,
+            workers=LOCAL_WORKERS,
+            intra_op_threads=LOCAL_INTRA_OP_THREADS,
+            prompt=LOCAL_PROMPT,
+        )
+        await asyncio.to_thread(LOCAL_EMBEDDER.load)
+        SEARCH_TARGETS = [(UpstreamHealth("local", CIRCUIT_FAILURES, CIRCUIT_OPEN_SECONDS), _local_search_batch)]
+    elif SEARCH_BACKEND == "tei":
+        SEARCH_TARGETS = [
+            (UpstreamHealth(url, CIRCUIT_FAILURES, CIRCUIT_OPEN_SECONDS), functools.partial(_tei_search_batch, url))
+            for url in SEARCH_UPSTREAM_URLS
+        ]
+    else:
+        raise RuntimeError(f"unsupported PPLX_SEARCH_BACKEND: {SEARCH_BACKEND}")
+    if SEARCH_OPENROUTER_FALLBACK and OPENROUTER_API_KEY:
+        # Same model as the index path, so its vectors live in the same space.
+        SEARCH_FALLBACK = (UpstreamHealth("openrouter", CIRCUIT_FAILURES, CIRCUIT_OPEN_SECONDS), _openrouter_search_batch)
+    await _warm_up_upstream(SEARCH_CLIENT)
+    SEARCH_BATCHER = SearchBatcher(
+        window_seconds=SEARCH_BATCH_WINDOW_MS / 1000,
+        max_inputs=SEARCH_UPSTREAM_BATCH_SIZE,
+        max_tokens=SEARCH_BATCH_MAX_TOKENS,
+    )
+    SEARCH_CACHE = EmbeddingCache(
+        max_bytes=int(SEARCH_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds=SEARCH_CACHE_TTL_SECONDS,
+        disk_path=Path(SEARCH_CACHE_DISK_PATH) if SEARCH_CACHE_DISK_PATH else None,
+        disk_max_entries=SEARCH_CACHE_DISK_MAX_ENTRIES,
+    )
+    if INDEX_CACHE_PATH:
+        INDEX_CACHE = IndexEmbeddingStore(Path(INDEX_CACHE_PATH), MODEL_ID, EMBED_DIM)
     yield
-    await CLIENT.aclose()
-    CLIENT = None
+    if INDEX_CACHE is not None:
+        INDEX_CACHE.close()
+        INDEX_CACHE = None
+    SEARCH_CACHE.close()
+    SEARCH_CACHE = None
+    SEARCH_BATCHER = None
+    if LOCAL_EMBEDDER is not None:
+        LOCAL_EMBEDDER.close()
+        LOCAL_EMBEDDER = None
+    await SEARCH_CLIENT.aclose()
+    await INDEX_CLIENT.aclose()
+    SEARCH_CLIENT = None
+    INDEX_CLIENT = None
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    route = request.url.path
+    if route not in EMBED_ROUTES:
+        return await call_next(request)
+    REQUESTS_IN_FLIGHT.inc(route=route)
+    status = "500"
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+        REQUESTS_IN_FLIGHT.dec(route=route)
+        REQUESTS.inc(route=route, status=status)
+
+
+def _collect_component_stats():
+    components = [
+        ("search_batcher", SEARCH_BATCHER),
+        ("search_cache", SEARCH_CACHE),
+        ("index_cache", INDEX_CACHE),
+    ]
+    for component, source in components:
+        if source is None:
+            continue
+        for key, value in source.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            yield (
+                f"pplx_embedder_{component}_{key}",
+                f"{component} {key.replace('_', ' ')}.",
+                "gauge",
+                [({}, value)],
+            )
+
+
+METRICS.collector(_collect_component_stats)
+
+
+def _collect_search_upstreams():
+    targets = [health for health, _ in SEARCH_TARGETS]
+    if SEARCH_FALLBACK is not None:
+        targets.append(SEARCH_FALLBACK[0])
+    yield (
+        "pplx_embedder_search_upstream_available",
+        "1 while the upstream's circuit is closed or half-open.",
+        "gauge",
+        [({"upstream": health.name}, 1 if health.available() else 0) for health in targets],
+    )
+
+
+METRICS.collector(_collect_search_upstreams)
+
+
+def _all_pool_stats() -> dict[str, dict[str, int] | None]:
+    return {"search": _pool_stats("search", SEARCH_CLIENT), "index": _pool_stats("index", INDEX_CLIENT)}
+
+
+def _collect_pool_stats():
+    pools = [(name, stats) for name, stats in _all_pool_stats().items() if stats is not None]
+    keys = dict.fromkeys(key for _, stats in pools for key in stats)
+    for key in keys:
+        yield (
+            f"pplx_embedder_pool_{key}",
+            f"Upstream HTTP pool {key.replace('_', ' ')}.",
+            "gauge",
+            [({"pool": name}, stats[key]) for name, stats in pools if key in stats],
+        )
+
+
+METRICS.collector(_collect_pool_stats)
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(content=METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/health")
 def health() -> dict[str, Any]:
     return {
-        "ok": CLIENT is not None,
+        "ok": SEARCH_CLIENT is not None,
         "model": MODEL_ID,
-        "search_upstream_url": SEARCH_UPSTREAM_URL,
+        "search_backend": SEARCH_BACKEND,
+        "search_upstreams": [health.stats() for health, _ in SEARCH_TARGETS],
+        "search_fallback": SEARCH_FALLBACK[0].stats() if SEARCH_FALLBACK is not None else None,
+        "search_hedge": SEARCH_HEDGE,
+        "search_local": LOCAL_EMBEDDER.info() if LOCAL_EMBEDDER is not None else None,
         "search_upstream_batch_size": SEARCH_UPSTREAM_BATCH_SIZE,
+        "search_batching": SEARCH_BATCHER.stats() if SEARCH_BATCHER is not None else None,
+        "search_cache": SEARCH_CACHE.stats() if SEARCH_CACHE is not None else None,
         "index_upstream_url": OPENROUTER_URL,
         "index_upstream_batch_size": INDEX_UPSTREAM_BATCH_SIZE,
+        "index_upstream_concurrency": INDEX_UPSTREAM_CONCURRENCY,
+        "index_upstream_retries": INDEX_UPSTREAM_RETRIES,
+        "index_cache": INDEX_CACHE.stats() if INDEX_CACHE is not None else None,
         "dimensions": EMBED_DIM,
         "normalize": NORMALIZE,
+        "quantize": QUANTIZE,
         "timeout_seconds": HTTP_TIMEOUT,
+        "pools": _all_pool_stats(),
     }
 
 
@@ -168,22 +785,39 @@ def _embed_response(vectors: np.ndarray) -> EmbedResponse:
     return EmbedResponse(embeddings=embeddings, dimensions=int(vectors.shape[1]), model=MODEL_ID)
 
 
+def _record_inputs(request: Request, inputs: list[str]) -> None:
+    INPUTS.inc(len(inputs), route=request.url.path)
+    REQUEST_INPUTS.observe(len(inputs), route=request.url.path)
+
+
 def _coerce_inputs(value: str | list[str]) -> list[str]:
     if isinstance(value, str):
         return [value]
     return value
 
 
-def _openai_response(vectors: np.ndarray) -> dict[str, Any]:
+def _response_rows(vectors: np.ndarray) -> Any:
+    # orjson serializes contiguous float32 rows natively; otherwise convert once.
+    if orjson is not None:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    return vectors.tolist()
+
+
+def _openai_response(vectors: np.ndarray, encoding_format: str | None = None) -> dict[str, Any]:
+    if encoding_format == "base64":
+        buffer = np.ascontiguousarray(vectors, dtype="<f4")
+        rows: Any = [base64.b64encode(row.tobytes()).decode("ascii") for row in buffer]
+    else:
+        rows = _response_rows(vectors)
     return {
         "object": "list",
         "data": [
             {
                 "object": "embedding",
                 "index": idx,
-                "embedding": row.tolist(),
+                "embedding": row,
             }
-            for idx, row in enumerate(vectors)
+            for idx, row in enumerate(rows)
         ],
         "model": MODEL_ID,
         "usage": {
@@ -195,22 +829,30 @@ def _openai_response(vectors: np.ndarray) -> dict[str, Any]:
 
 def _standard_response(vectors: np.ndarray) -> dict[str, Any]:
     return {
-        "embeddings": [{"values": row.tolist()} for row in vectors],
+        "embeddings": [{"values": row} for row in _response_rows(vectors)],
         "dimensions": int(vectors.shape[1]) if vectors.ndim == 2 else EMBED_DIM,
         "model": MODEL_ID,
     }
 
 
 def _json_response(payload: dict[str, Any]) -> Response:
-    return Response(
-        content=json.dumps(payload, separators=(",", ":")),
-        media_type="application/json",
-    )
+    if orjson is not None:
+        content = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        content = json.dumps(payload, separators=(",", ":"))
+    return Response(content=content, media_type="application/json")
+
+
+def _encoding_format(payload: dict[str, Any]) -> str | None:
+    encoding_format = payload.get("encoding_format")
+    if encoding_format not in {None, "float", "base64"}:
+        raise HTTPException(status_code=400, detail=f"unsupported encoding_format: {encoding_format}")
+    return encoding_format
 
 
 async def _parse_request_json(request: Request) -> dict[str, Any]:
     try:
-        payload = await request.json()
+        payload = _loads(await request.body())
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"invalid json: {exc}") from exc
     if not isinstance(payload, dict):
@@ -220,15 +862,18 @@ async def _parse_request_json(request: Request) -> dict[str, Any]:
 
 @app.post("/search-embed")
 async def search_embed(request: Request) -> Response:
-    if CLIENT is None:
+    if SEARCH_CLIENT is None or SEARCH_BATCHER is None:
         raise HTTPException(status_code=503, detail="proxy not ready")
     payload = await _parse_request_json(request)
     inputs = _coerce_inputs(payload.get("inputs", []))
+    _record_inputs(request, inputs)
     if not inputs:
         return _json_response(_standard_response(np.empty((0, EMBED_DIM), dtype=np.float32)))
 
     try:
-        vectors = await _fetch_search_embeddings(CLIENT, inputs)
+        vectors = quantize(await _search_embeddings(inputs), QUANTIZE, NORMALIZE)
+    except UpstreamsFailed as exc:
+        raise HTTPException(status_code=502, detail=f"all upstreams failed: {exc}") from exc
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"upstream error: {exc}") from exc
     except ValueError as exc:
@@ -239,17 +884,20 @@ async def search_embed(request: Request) -> Response:
 
 @app.post("/index-embed")
 async def index_embed(request: Request) -> Response:
-    if CLIENT is None:
+    if INDEX_CLIENT is None:
         raise HTTPException(status_code=503, detail="proxy not ready")
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=503, detail="OpenRouter API key not configured")
     payload = await _parse_request_json(request)
     inputs = _coerce_inputs(payload.get("inputs", []))
+    _record_inputs(request, inputs)
     if not inputs:
         return _json_response(_standard_response(np.empty((0, EMBED_DIM), dtype=np.float32)))
 
     try:
-        vectors = await _fetch_index_embeddings(CLIENT, inputs)
+        vectors = quantize(await _index_embeddings(inputs), QUANTIZE, NORMALIZE)
+    except UpstreamsFailed as exc:
+        raise HTTPException(status_code=502, detail=f"all upstreams failed: {exc}") from exc
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"upstream error: {exc}") from exc
     except ValueError as exc:
@@ -266,42 +914,50 @@ async def embed(request: Request) -> Response:
 
 @app.post("/openai-search/v1/embeddings")
 async def openai_search_embed(request: Request) -> Response:
-    if CLIENT is None:
+    if SEARCH_CLIENT is None or SEARCH_BATCHER is None:
         raise HTTPException(status_code=503, detail="proxy not ready")
     payload = await _parse_request_json(request)
+    encoding_format = _encoding_format(payload)
     inputs = _coerce_inputs(payload.get("input", []))
+    _record_inputs(request, inputs)
     if not inputs:
-        return _json_response(_openai_response(np.empty((0, EMBED_DIM), dtype=np.float32)))
+        return _json_response(_openai_response(np.empty((0, EMBED_DIM), dtype=np.float32), encoding_format))
 
     try:
-        vectors = await _fetch_search_embeddings(CLIENT, inputs)
+        vectors = quantize(await _search_embeddings(inputs), QUANTIZE, NORMALIZE)
+    except UpstreamsFailed as exc:
+        raise HTTPException(status_code=502, detail=f"all upstreams failed: {exc}") from exc
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"upstream error: {exc}") from exc
     except ValueError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
 
-    return _json_response(_openai_response(vectors))
+    return _json_response(_openai_response(vectors, encoding_format))
 
 
 @app.post("/openai-index/v1/embeddings")
 async def openai_index_embed(request: Request) -> Response:
-    if CLIENT is None:
+    if INDEX_CLIENT is None:
         raise HTTPException(status_code=503, detail="proxy not ready")
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=503, detail="OpenRouter API key not configured")
     payload = await _parse_request_json(request)
+    encoding_format = _encoding_format(payload)
     inputs = _coerce_inputs(payload.get("input", []))
+    _record_inputs(request, inputs)
     if not inputs:
-        return _json_response(_openai_response(np.empty((0, EMBED_DIM), dtype=np.float32)))
+        return _json_response(_openai_response(np.empty((0, EMBED_DIM), dtype=np.float32), encoding_format))
 
     try:
-        vectors = await _fetch_index_embeddings(CLIENT, inputs)
+        vectors = quantize(await _index_embeddings(inputs), QUANTIZE, NORMALIZE)
+    except UpstreamsFailed as exc:
+        raise HTTPException(status_code=502, detail=f"all upstreams failed: {exc}") from exc
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"upstream error: {exc}") from exc
     except ValueError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
 
-    return _json_response(_openai_response(vectors))
+    return _json_response(_openai_response(vectors, encoding_format))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Callable, Iterator
+
+
+POOL_MAX_AGE_SECONDS = float(os.environ.get("OPS_DB_MAX_AGE_SECONDS", "900"))
+
+
+def log(*parts: object) -> None:
+    print(datetime.now(UTC).isoformat(), *parts, flush=True)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 5
+    base_seconds: float = 5.0
+    max_seconds: float = 60.0
+    jitter: float = 0.25
+
+    def delay(self, attempt: int) -> float:
+        seconds = min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1))
+        # Jitter keeps parallel workers from reconnecting in lockstep.
+        return seconds * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+
+DEFAULT_RETRY = RetryPolicy(
+    attempts=int(os.environ.get("OPS_RETRY_ATTEMPTS", "5")),
+    base_seconds=float(os.environ.get("OPS_RETRY_BASE_SECONDS", "5")),
+    max_seconds=float(os.environ.get("OPS_RETRY_MAX_SECONDS", "60")),
+)
+
+
+def with_retries(label: str, fn, policy: RetryPolicy = DEFAULT_RETRY):
+    last_error = None
+    for attempt in range(1, policy.attempts + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            last_error = exc
+            log(f"{label}:retry", attempt, "error", repr(exc))
+            if attempt == policy.attempts:
+                break
+            time.sleep(policy.delay(attempt))
+    raise last_error  # type: ignore[misc]
+
+
+def close_quietly(conn) -> None:
+    if conn is None:
+        return
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Small thread-safe pool over the pipeline's ``get_connection``.
+
+    Idle connections are pinged on every checkout, since the server or a NAT can
+    drop them at any time; connections older than ``max_age_seconds`` are
+    replaced, and a connection that raised while checked out is discarded rather
+    than reused.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], object],
+        *,
+        max_size: int = 4,
+        max_age_seconds: float = POOL_MAX_AGE_SECONDS,
+        retry: RetryPolicy = DEFAULT_RETRY,
+        label: str = "db",
+    ) -> None:
+        self.connect = connect
+        self.max_size = max(1, max_size)
+        self.max_age_seconds = max_age_seconds
+        self.retry = retry
+        self.label = label
+        self._cond = threading.Condition()
+        # Idle connections with their created_at, most recently returned last.
+        self._idle: list[tuple[object, float]] = []
+        self._created_at: dict[int, float] = {}
+        # Connections checked out, idle, or being opened.
+        self._open = 0
+        self._closed = False
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            self._discard(conn)
+            raise
+        self._release(conn)
+
+    def run(self, fn, *args):
+        with self.connection() as conn:
+            return fn(conn, *args)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for conn, _ in idle:
+                if self._created_at.pop(id(conn), None) is not None:
+                    self._open -= 1
+            self._cond.notify_all()
+        for conn, _ in idle:
+            close_quietly(conn)
+
+    def _acquire(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError(f"{self.label} pool is closed")
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                elif self._open < self.max_size:
+                    # Reserve the slot, then connect outside the lock.
+                    self._open += 1
+                    conn = None
+                else:
+                    self._cond.wait()
+                    continue
+
+            if conn is None:
+                try:
+                    conn = with_retries(f"{self.label}:connect", self.connect, self.retry)
+                except BaseException:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created_at[id(conn)] = time.monotonic()
+                return conn
+
+            if time.monotonic() - created_at > self.max_age_seconds:
+                self._discard(conn)
+                continue
+            if not self._healthy(conn):
+                log(f"{self.label}:health_check_failed")
+                self._discard(conn)
+                continue
+            return conn
+
+    def _release(self, conn) -> None:
+        if getattr(conn, "closed", False):
+            self._discard(conn)
+            return
+        try:
+            # Never hand out a connection with an open transaction.
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            created_at = self._created_at.get(id(conn))
+            if created_at is None or self._closed:
+                if self._created_at.pop(id(conn), None) is not None:
+                    self._open -= 1
+                release = False
+            else:
+                self._idle.append((conn, created_at))
+                release = True
+            self._cond.notify()
+        if not release:
+            close_quietly(conn)
+
+    def _discard(self, conn) -> None:
+        with self._cond:
+            if self._created_at.pop(id(conn), None) is not None:
+                self._open -= 1
+            self._cond.notify()
+        close_quietly(conn)
+
+    @staticmethod
+    def _healthy(conn) -> bool:
+        if getattr(conn, "closed", False):
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import argparse
+import multiprocessing
 import os
 import sys
 import time
@@ -9,242 +11,272 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from meili_delete import RemovedDocDeleter
+from meili_reload import PendingIdCursor, PipelinedLoader, ReloadCheckpoint
+from pg_pool import DEFAULT_RETRY, ConnectionPool, log, with_retries
+
 
 DOPEJOBS_ROOT = Path("/Users/aburkard/fun/dopejobs")
 PIPELINE_ROOT = Path("/Users/aburkard/fun/dope-jobs-pipeline")
 ENV_PATH = DOPEJOBS_ROOT / ".env"
 MEILI_HOST = "http://127.0.0.1:17701"
 MEILI_KEY_FALLBACK = "b5ec361a9058eea40af00d05c2ef76e1cc9ba7be"
+MEILI_INDEX_UID = "jobs"
 BATCH_SIZE = 200
-RETRY_SLEEP_SECONDS = 5
+MAX_IN_FLIGHT = int(os.environ.get("MEILI_RELOAD_MAX_IN_FLIGHT", "4"))
+PREFETCH_BATCHES = int(os.environ.get("MEILI_RELOAD_PREFETCH_BATCHES", "4"))
+MAX_QUEUE_DEPTH = int(os.environ.get("MEILI_RELOAD_MAX_QUEUE_DEPTH", "20"))
+CHECKPOINT_PATH = Path(
+    os.environ.get(
+        "MEILI_RECOMPUTE_CHECKPOINT", DOPEJOBS_ROOT / "tmp" / "recompute_and_reload_all_jobs.checkpoint.json"
+    )
+)
+DELETE_CHUNK_SIZE = int(os.environ.get("MEILI_DELETE_CHUNK_SIZE", "1000"))
+DELETE_BOARD_FILTER_MIN_IDS = int(os.environ.get("MEILI_DELETE_BOARD_FILTER_MIN_IDS", "500"))
 JOB_GROUP_PROGRESS_EVERY = 25
-DB_CONN_RESET_EVERY = 100
 
 
-def log(*parts: object) -> None:
-    print(datetime.now(UTC).isoformat(), *parts, flush=True)
+BOARD_LIST_SQL = """
+    WITH boards_with_dupes AS (
+        SELECT ats, board_token
+        FROM pipeline_jobs
+        WHERE removed_at IS NULL AND raw_json IS NOT NULL {board_filter}
+        GROUP BY ats, board_token, title
+        HAVING COUNT(*) > 1
+    ),
+    boards_with_groups AS (
+        SELECT DISTINCT ats, board_token
+        FROM pipeline_jobs
+        WHERE removed_at IS NULL AND raw_json IS NOT NULL AND job_group IS NOT NULL {board_filter}
+    ),
+    relevant_boards AS (
+        SELECT ats, board_token FROM boards_with_dupes
+        UNION
+        SELECT ats, board_token FROM boards_with_groups
+    )
+    SELECT rb.ats, rb.board_token, COUNT(*)
+    FROM relevant_boards rb
+    JOIN pipeline_jobs pj
+      ON pj.ats = rb.ats
+     AND pj.board_token = rb.board_token
+    WHERE pj.removed_at IS NULL AND pj.raw_json IS NOT NULL
+    GROUP BY rb.ats, rb.board_token
+    ORDER BY COUNT(*) DESC, rb.ats, rb.board_token
+"""
+
+CLAIMED_BOARD_FILTER = """
+          AND (ats, board_token) IN (
+              SELECT ats, board_token FROM job_group_dirty_boards WHERE claimed_by = %(pass_id)s
+          )
+"""
+
+
+def claim_dirty_boards(conn, pass_id: str) -> int | None:
+    """Claim every board marked since the last successful pass; None if untracked."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('job_group_dirty_boards') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.commit()
+            return None
+        # Claims left behind by a failed pass are taken over too.
+        cur.execute("UPDATE job_group_dirty_boards SET claimed_by = %s", (pass_id,))
+        claimed = cur.rowcount
+    conn.commit()
+    return claimed
+
+
+def release_claimed_boards(conn, pass_id: str) -> int:
+    with conn.cursor() as cur:
+        # Boards re-marked during the pass had their claim cleared and stay dirty.
+        cur.execute("DELETE FROM job_group_dirty_boards WHERE claimed_by = %s", (pass_id,))
+        released = cur.rowcount
+    conn.commit()
+    return released
+
+
+# Per-process state for job-group workers; each process keeps its own connection.
+_worker_pool: ConnectionPool | None = None
+
+
+def load_pipeline_modules() -> None:
+    load_dotenv(ENV_PATH)
+    if str(PIPELINE_ROOT) not in sys.path:
+        sys.path.insert(0, str(PIPELINE_ROOT))
+
+
+def recompute_board(board: tuple[str, str, int]) -> tuple[str, str, int, int, dict[str, int]]:
+    global _worker_pool
 
+    load_pipeline_modules()
+    from db import get_connection
+    from job_groups import recompute_job_groups_for_boards
+
+    if _worker_pool is None:
+        _worker_pool = ConnectionPool(get_connection, max_size=1, label="job_groups:db")
 
-def with_retries(label: str, fn, retries: int = 5):
-    last_error = None
-    for attempt in range(1, retries + 1):
+    ats, board_token, job_count = board
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            return fn()
+            changed_ids, stats = _worker_pool.run(recompute_job_groups_for_boards, [(ats, board_token)])
+            break
         except Exception as exc:
-            last_error = exc
-            log(f"{label}:retry", attempt, "error", repr(exc))
-            if attempt == retries:
-                break
-            time.sleep(RETRY_SLEEP_SECONDS * attempt)
-    raise last_error  # type: ignore[misc]
+            log(f"job_groups:{ats}/{board_token}:retry", attempt, "error", repr(exc))
+            if attempt >= DEFAULT_RETRY.attempts:
+                raise
+            time.sleep(DEFAULT_RETRY.delay(attempt))
+
+    return ats, board_token, job_count, len(changed_ids), stats
+
+
+def close_worker_pool() -> None:
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.close()
+        _worker_pool = None
+
+
+def recompute_job_groups(boards: list[tuple[str, str, int]], workers: int) -> dict[str, int]:
+    """Recompute job groups board by board, spread over ``workers`` processes.
 
+    ``boards`` arrive largest first, and handing them out one at a time lets idle
+    workers pick up the next-largest board, which keeps the pool balanced.
+    """
+    totals = {"changed_ids": 0, "groups": 0, "grouped_jobs": 0, "singletons": 0}
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(processes=workers, initializer=load_pipeline_modules)
+        results = pool.imap_unordered(recompute_board, boards, chunksize=1)
+    else:
+        results = map(recompute_board, boards)
 
-def close_quietly(conn) -> None:
-    if conn is None:
-        return
     try:
-        conn.close()
-    except Exception:
-        pass
+        for index, (ats, board_token, job_count, changed, stats) in enumerate(results, start=1):
+            totals["changed_ids"] += changed
+            totals["groups"] += stats["groups"]
+            totals["grouped_jobs"] += stats["grouped_jobs"]
+            totals["singletons"] += stats["singletons"]
+
+            if (
+                index == 1
+                or index % JOB_GROUP_PROGRESS_EVERY == 0
+                or changed > 0
+                or index == len(boards)
+            ):
+                log(
+                    "job_groups:progress",
+                    f"{index}/{len(boards)}",
+                    f"{ats}/{board_token}",
+                    "jobs",
+                    job_count,
+                    "changed",
+                    changed,
+                    "groups",
+                    stats["groups"],
+                    "grouped_jobs",
+                    stats["grouped_jobs"],
+                    "singletons",
+                    stats["singletons"],
+                )
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        close_worker_pool()
+    return totals
 
 
 def main() -> int:
-    load_dotenv(ENV_PATH)
-    sys.path.insert(0, str(PIPELINE_ROOT))
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("JOB_GROUP_WORKERS", "1")),
+        help="Processes for the job-group pass, each with its own Postgres connection",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Recompute job groups on every relevant board, not only boards changed since the last pass",
+    )
+    args = parser.parse_args()
 
-    from db import get_connection, get_job_ids_pending_meili_load, get_removed_job_ids
-    from job_groups import recompute_job_groups_for_boards
+    load_pipeline_modules()
+
+    from db import MEILI_DOC_SCHEMA_VERSION, get_connection
     from pipeline import step_load
 
     meili_key = os.environ.get("MEILISEARCH_MASTER_KEY") or MEILI_KEY_FALLBACK
 
-    def get_boards_requiring_job_group_pass() -> list[tuple[str, str, int]]:
-        conn = get_connection()
-        try:
+    pool = ConnectionPool(get_connection, max_size=MAX_IN_FLIGHT + 1, label="db")
+    try:
+        pass_id = f"{datetime.now(UTC).isoformat()}:{os.getpid()}"
+        claimed = with_retries("job_groups:claim", lambda: pool.run(claim_dirty_boards, pass_id))
+        incremental = not args.full and claimed is not None
+        if claimed is None:
+            log("job_groups:change_tracking_missing", "running full pass")
+
+        def get_boards_requiring_job_group_pass(conn) -> list[tuple[str, str, int]]:
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    WITH boards_with_dupes AS (
-                        SELECT ats, board_token
-                        FROM pipeline_jobs
-                        WHERE removed_at IS NULL AND raw_json IS NOT NULL
-                        GROUP BY ats, board_token, title
-                        HAVING COUNT(*) > 1
-                    ),
-                    boards_with_groups AS (
-                        SELECT DISTINCT ats, board_token
-                        FROM pipeline_jobs
-                        WHERE removed_at IS NULL AND raw_json IS NOT NULL AND job_group IS NOT NULL
-                    ),
-                    relevant_boards AS (
-                        SELECT ats, board_token FROM boards_with_dupes
-                        UNION
-                        SELECT ats, board_token FROM boards_with_groups
-                    )
-                    SELECT rb.ats, rb.board_token, COUNT(*)
-                    FROM relevant_boards rb
-                    JOIN pipeline_jobs pj
-                      ON pj.ats = rb.ats
-                     AND pj.board_token = rb.board_token
-                    WHERE pj.removed_at IS NULL AND pj.raw_json IS NOT NULL
-                    GROUP BY rb.ats, rb.board_token
-                    ORDER BY COUNT(*) DESC, rb.ats, rb.board_token
-                    """
-                )
+                if incremental:
+                    cur.execute(BOARD_LIST_SQL.format(board_filter=CLAIMED_BOARD_FILTER), {"pass_id": pass_id})
+                else:
+                    cur.execute(BOARD_LIST_SQL.format(board_filter=""))
                 return [(ats, board_token, count) for ats, board_token, count in cur.fetchall()]
-        finally:
-            conn.close()
-
-    boards = with_retries("job_groups:board_list", get_boards_requiring_job_group_pass)
-    log("job_groups:start", "boards", len(boards))
-
-    total_changed = 0
-    total_groups = 0
-    total_grouped_jobs = 0
-    total_singletons = 0
-    conn = None
-    for index, (ats, board_token, job_count) in enumerate(boards, start=1):
-        if conn is None:
-            conn = with_retries("job_groups:connect", get_connection)
-
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                changed_ids, stats = recompute_job_groups_for_boards(conn, [(ats, board_token)])
-                break
-            except Exception as exc:
-                log(f"job_groups:{ats}/{board_token}:retry", attempt, "error", repr(exc))
-                close_quietly(conn)
-                conn = None
-                if attempt >= 5:
-                    raise
-                time.sleep(RETRY_SLEEP_SECONDS * attempt)
-                conn = with_retries("job_groups:reconnect", get_connection)
-
-        total_changed += len(changed_ids)
-        total_groups += stats["groups"]
-        total_grouped_jobs += stats["grouped_jobs"]
-        total_singletons += stats["singletons"]
-
-        if (
-            index == 1
-            or index % JOB_GROUP_PROGRESS_EVERY == 0
-            or len(changed_ids) > 0
-            or index == len(boards)
-        ):
-            log(
-                "job_groups:progress",
-                f"{index}/{len(boards)}",
-                f"{ats}/{board_token}",
-                "jobs",
-                job_count,
-                "changed",
-                len(changed_ids),
-                "groups",
-                stats["groups"],
-                "grouped_jobs",
-                stats["grouped_jobs"],
-                "singletons",
-                stats["singletons"],
-            )
-        if index % DB_CONN_RESET_EVERY == 0:
-            close_quietly(conn)
-            conn = None
-
-    close_quietly(conn)
-
-    log(
-        "job_groups:done",
-        {
-            "changed_ids": total_changed,
-            "groups": total_groups,
-            "grouped_jobs": total_grouped_jobs,
-            "singletons": total_singletons,
-        },
-    )
-
-    def delete_removed():
-        conn = get_connection()
-        try:
-            removed_ids = get_removed_job_ids(conn)
-            if not removed_ids:
-                return 0
-            log("meili:delete_removed", len(removed_ids))
-            step_load(
-                conn,
-                meili_host=MEILI_HOST,
-                meili_key=meili_key,
-                parsed_job_ids=[],
-                removed_job_ids=removed_ids,
-                meili_batch_size=BATCH_SIZE,
-            )
-            return len(removed_ids)
-        finally:
-            conn.close()
-
-    with_retries("meili:delete_removed", delete_removed)
-
-    batch_num = 0
-    total_loaded = 0
-    conn = None
-    while True:
-        if conn is None:
-            conn = with_retries("meili:connect", get_connection)
 
-        try:
-            pending_ids = get_job_ids_pending_meili_load(conn, limit=BATCH_SIZE)
-        except Exception as exc:
-            log("meili:pending:retry", batch_num + 1, "error", repr(exc))
-            close_quietly(conn)
-            conn = None
-            time.sleep(RETRY_SLEEP_SECONDS)
-            continue
-        if not pending_ids:
-            log("meili:done_no_pending", "total_loaded", total_loaded)
-            break
-
-        batch_num += 1
-        total_loaded += len(pending_ids)
+        boards = with_retries("job_groups:board_list", lambda: pool.run(get_boards_requiring_job_group_pass))
         log(
-            "meili:batch",
-            batch_num,
-            "size",
-            len(pending_ids),
-            "first",
-            pending_ids[0],
-            "last",
-            pending_ids[-1],
-            "total_loaded",
-            total_loaded,
+            "job_groups:start",
+            "boards",
+            len(boards),
+            "mode",
+            "incremental" if incremental else "full",
+            "changed_boards",
+            claimed,
+            "workers",
+            max(1, args.workers),
         )
+        totals = recompute_job_groups(boards, args.workers)
+        log("job_groups:done", totals)
+        if claimed is not None:
+            released = with_retries("job_groups:release", lambda: pool.run(release_claimed_boards, pass_id))
+            log("job_groups:changes_cleared", released)
+
+        RemovedDocDeleter(
+            pool=pool,
+            step_load=step_load,
+            meili_host=MEILI_HOST,
+            meili_key=meili_key,
+            index_uid=MEILI_INDEX_UID,
+            chunk_size=DELETE_CHUNK_SIZE,
+            max_in_flight=MAX_IN_FLIGHT,
+            max_queue_depth=MAX_QUEUE_DEPTH,
+            board_filter_min_ids=DELETE_BOARD_FILTER_MIN_IDS,
+        ).run()
+
+        checkpoint = ReloadCheckpoint(CHECKPOINT_PATH)
+        start_after = checkpoint.load()
+        if start_after:
+            log("meili:resume", "after", start_after, "checkpoint", str(CHECKPOINT_PATH))
+        PipelinedLoader(
+            pool=pool,
+            cursor=PendingIdCursor(MEILI_DOC_SCHEMA_VERSION, start_after=start_after),
+            checkpoint=checkpoint,
+            step_load=step_load,
+            meili_host=MEILI_HOST,
+            meili_key=meili_key,
+            index_uid=MEILI_INDEX_UID,
+            batch_size=BATCH_SIZE,
+            max_in_flight=MAX_IN_FLIGHT,
+            prefetch_batches=PREFETCH_BATCHES,
+            max_queue_depth=MAX_QUEUE_DEPTH,
+        ).run()
+    finally:
+        pool.close()
 
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                step_load(
-                    conn,
-                    meili_host=MEILI_HOST,
-                    meili_key=meili_key,
-                    parsed_job_ids=pending_ids,
-                    removed_job_ids=[],
-                    meili_batch_size=BATCH_SIZE,
-                )
-                break
-            except Exception as exc:
-                log(f"meili:batch:{batch_num}:retry", attempt, "error", repr(exc))
-                close_quietly(conn)
-                conn = None
-                if attempt >= 5:
-                    raise
-                time.sleep(RETRY_SLEEP_SECONDS * attempt)
-                conn = with_retries("meili:reconnect", get_connection)
-        if batch_num % DB_CONN_RESET_EVERY == 0:
-            close_quietly(conn)
-            conn = None
-
-    close_quietly(conn)
     log("all_done")
     return 0
 
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+
+T = TypeVar("T")
+MIN_LATENCY_SAMPLES = 20
+
+
+class UpstreamsFailed(Exception):
+    """Every attempt failed; ``errors`` holds each attempt's exception in the order they finished."""
+
+    def __init__(self, errors: list[BaseException]) -> None:
+        self.errors = errors
+        detail = "; ".join(f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__ for exc in errors)
+        super().__init__(detail or "no upstream available")
+
+
+class UpstreamHealth:
+    """Latency history and a consecutive-failure circuit breaker for one upstream.
+
+    After ``failure_threshold`` failures in a row the circuit opens for
+    ``open_seconds``. Once that passes the upstream is offered again; one success
+    closes the circuit, one more failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float, window: int = 256) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._open_until
+
+    def state(self) -> str:
+        if self._consecutive_failures < self.failure_threshold:
+            return "closed"
+        return "half_open" if self.available() else "open"
+
+    def record_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self.successes += 1
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        self.failures += 1
+        if self._consecutive_failures >= self.failure_threshold:
+            self._open_until = time.monotonic() + self.open_seconds
+
+    def percentile(self, q: float) -> float | None:
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict[str, object]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "name": self.name,
+            "state": self.state(),
+            "successes": self.successes,
+            "failures": self.failures,
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+        }
+
+
+async def _attempt(health: UpstreamHealth, call: Callable[[], Awaitable[T]], timeout: float) -> T:
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(call(), timeout)
+    except asyncio.CancelledError:
+        # Losing a hedge race says nothing about the upstream's health.
+        raise
+    except Exception:
+        health.record_failure()
+        raise
+    health.record_success(time.monotonic() - start)
+    return result
+
+
+async def hedged(
+    attempts: list[tuple[UpstreamHealth, Callable[[], Awaitable[T]]]],
+    *,
+    hedge_delay: float | None,
+    attempt_timeout: float,
+    on_extra_attempt: Callable[[str, str], None] | None = None,
+) -> T:
+    """Runs ``attempts`` in order until one succeeds, returning the first result.
+
+    The next attempt starts when the running ones have all failed ("failover"),
+    or when none has answered within ``hedge_delay`` ("hedge"). Whichever succeeds
+    first wins and the others are cancelled. If every attempt fails, raises
+    ``UpstreamsFailed`` whatever the individual errors were (HTTP errors,
+    timeouts, local-model failures).
+    """
+    if not attempts:
+        raise UpstreamsFailed([])
+    pending: set[asyncio.Task] = set()
+    errors: list[BaseException] = []
+    launched = 0
+
+    def launch(reason: str | None) -> None:
+        nonlocal launched
+        health, call = attempts[launched]
+        launched += 1
+        if reason is not None and on_extra_attempt is not None:
+            on_extra_attempt(reason, health.name)
+        pending.add(asyncio.ensure_future(_attempt(health, call, attempt_timeout)))
+
+    launch(None)
+    try:
+        while pending:
+            can_hedge = hedge_delay is not None and launched < len(attempts)
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch("hedge")
+                continue
+            for task in done:
+                pending.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+            if not pending and launched < len(attempts):
+                launch("failover")
+    finally:
+        for task in pending:
+            task.cancel()
+    raise UpstreamsFailed(errors) from errors[-1]
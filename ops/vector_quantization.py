@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+QUANTIZE_MODES = ("none", "int8", "binary")
+INT8_SCALE = 127.0
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1)
+    np.maximum(norms, 1e-12, out=norms)
+    return vectors / norms[:, None]
+
+
+def truncate_dims(vectors: np.ndarray, dims: int) -> np.ndarray:
+    """Matryoshka truncation: keep the leading ``dims`` components and renormalize."""
+    if dims <= 0 or dims >= vectors.shape[1]:
+        return vectors
+    return l2_normalize(np.ascontiguousarray(vectors[:, :dims]))
+
+
+def quantize(vectors: np.ndarray, mode: str, normalize: bool = True) -> np.ndarray:
+    """Snap unit vectors onto a quantized grid and return them as float32.
+
+    ``int8`` rounds each component to one of 255 levels, the precision an int8
+    vector store keeps. ``binary`` keeps only the sign of each component, which is
+    what a Meilisearch ``binaryQuantized`` embedder stores. Both are re-normalized so
+    cosine scores stay comparable.
+    """
+    if mode == "none" or not vectors.size:
+        return vectors
+    if mode == "int8":
+        snapped = np.clip(np.rint(vectors * INT8_SCALE), -INT8_SCALE, INT8_SCALE) / INT8_SCALE
+    elif mode == "binary":
+        snapped = np.where(vectors >= 0, 1.0, -1.0)
+    else:
+        raise ValueError(f"unsupported quantization mode: {mode}")
+    snapped = snapped.astype(np.float32, copy=False)
+    return l2_normalize(snapped) if normalize else snapped
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int, chunk_size: int = 256) -> np.ndarray:
+    """Indices of the ``k`` highest dot-product corpus rows for each query, best first."""
+    k = min(k, corpus.shape[0])
+    results = np.empty((queries.shape[0], k), dtype=np.int64)
+    for start in range(0, queries.shape[0], chunk_size):
+        scores = queries[start:start + chunk_size] @ corpus.T
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+        results[start:start + chunk_size] = np.take_along_axis(idx, order, axis=1)
+    return results
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Mean fraction of each reference top-k found in the candidate top-k."""
+    if not reference.size:
+        return 0.0
+    hits = sum(len(set(ref) & set(cand)) for ref, cand in zip(reference.tolist(), candidate.tolist()))
+    return hits / reference.size
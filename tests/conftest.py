@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+
+# ops/ scripts import their siblings by bare name (``from pg_pool import ...``), as they do when run there.
+OPS_DIR = str(Path(__file__).resolve().parent.parent / "ops")
+if OPS_DIR not in sys.path:
+    sys.path.insert(0, OPS_DIR)
@@ -0,0 +1,66 @@
+"""Prometheus text rendering in ops/embedder_metrics.py."""
+from ops.embedder_metrics import Registry
+
+
+def test_counter_and_gauge_render_sorted_labelled_samples():
+    metrics = Registry()
+    requests = metrics.counter("app_requests_total", "Requests.", ("route", "status"))
+    in_flight = metrics.gauge("app_in_flight", "In flight.")
+    requests.inc(route="/b", status="200")
+    requests.inc(route="/a", status="500")
+    requests.inc(2, route="/b", status="200")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert metrics.render().splitlines() == [
+        "# HELP app_requests_total Requests.",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{route="/a",status="500"} 1',
+        'app_requests_total{route="/b",status="200"} 3',
+        "# HELP app_in_flight In flight.",
+        "# TYPE app_in_flight gauge",
+        "app_in_flight 1",
+    ]
+
+
+def test_gauge_set_and_fractional_values():
+    metrics = Registry()
+    ratio = metrics.gauge("app_ratio", "Ratio.")
+    ratio.set(0.25)
+    assert "app_ratio 0.25" in metrics.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Registry()
+    seconds = metrics.histogram("app_seconds", "Latency.", ("upstream",), buckets=(0.5, 0.1))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        seconds.observe(value, upstream="tei")
+
+    assert metrics.render().splitlines()[2:] == [
+        'app_seconds_bucket{upstream="tei",le="0.1"} 2',
+        'app_seconds_bucket{upstream="tei",le="0.5"} 3',
+        'app_seconds_bucket{upstream="tei",le="+Inf"} 4',
+        'app_seconds_sum{upstream="tei"} 2.45',
+        'app_seconds_count{upstream="tei"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    metrics = Registry()
+    errors = metrics.counter("app_errors_total", "Errors.", ("detail",))
+    errors.inc(detail='bad "quote"\\path\nline')
+    assert r'app_errors_total{detail="bad \"quote\"\\path\nline"} 1' in metrics.render().splitlines()
+
+
+def test_collectors_are_read_at_render_time():
+    metrics = Registry()
+    state = {"entries": 1}
+    metrics.collector(lambda: [("app_cache_entries", "Cache entries.", "gauge", [({"tier": "memory"}, state["entries"])])])
+    state["entries"] = 7
+
+    assert metrics.render().splitlines() == [
+        "# HELP app_cache_entries Cache entries.",
+        "# TYPE app_cache_entries gauge",
+        'app_cache_entries{tier="memory"} 7',
+    ]
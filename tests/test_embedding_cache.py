@@ -0,0 +1,97 @@
+"""Memory and disk tiers of ops/embedding_cache.py."""
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import ENTRY_OVERHEAD_BYTES, EmbeddingCache, cache_key, normalize_text
+
+
+def rows(count, dims=4):
+    return np.arange(count * dims, dtype=np.float32).reshape(count, dims)
+
+
+def disk_count(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+
+def test_keys_depend_on_normalized_text_model_and_dims():
+    assert normalize_text("  senior  rust\n engineer ") == "senior rust engineer"
+    assert normalize_text("café") == "café"
+    key = cache_key("rust engineer", "model", 512)
+    assert len(key) == 16
+    assert key == cache_key("rust engineer", "model", 512)
+    assert len({key, cache_key("rust engineer", "model", 256), cache_key("rust engineer", "other", 512)}) == 3
+
+
+def test_memory_tier_is_a_byte_bounded_lru():
+    entry_bytes = 16 + 16 + ENTRY_OVERHEAD_BYTES
+    cache = EmbeddingCache(max_bytes=2 * entry_bytes, ttl_seconds=60)
+    keys = [bytes([i]) * 16 for i in range(3)]
+    cache.put_many(keys[:2], rows(2))
+    cache.get_many([keys[0]])
+    cache.put_many(keys[2:], rows(1))
+
+    found = cache.get_many(keys)
+
+    assert [row is not None for row in found] == [True, False, True]
+    assert not found[0].flags.writeable
+    assert cache.stats()["bytes"] == 2 * entry_bytes
+    assert cache.evictions == 1
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = EmbeddingCache(max_bytes=1 << 20, ttl_seconds=10)
+    cache.put_many([b"k"], rows(1))
+    later = time.time() + 11
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: later)
+
+    assert cache.get_many([b"k"]) == [None]
+    assert (cache.expired, cache.misses) == (1, 1)
+
+
+def test_disk_tier_survives_restart_and_promotes_hits(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(max_bytes=1 << 20, ttl_seconds=60, disk_path=path)
+    cache.put_many([b"a", b"b"], rows(2))
+    cache.close()
+
+    cache = EmbeddingCache(max_bytes=1 << 20, ttl_seconds=60, disk_path=path)
+    found = cache.get_many([b"b", b"c"])
+    np.testing.assert_array_equal(found[0], [4, 5, 6, 7])
+    assert found[1] is None
+    cache.get_many([b"b"])
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 1, 1)
+    cache.close()
+
+
+def test_disk_tier_is_pruned_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "DISK_PRUNE_EVERY_ROWS", 10)
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(max_bytes=0, ttl_seconds=60, disk_path=path, disk_max_entries=8)
+    for batch in range(3):
+        cache.put_many([bytes([batch, i]) for i in range(4)], rows(4))
+    # 12 rows written, pruned back to the 8 newest once the 10th arrived.
+    assert disk_count(path) == 8
+    assert cache.disk_pruned == 4
+    assert cache.get_many([bytes([0, 0]), bytes([2, 3])])[0] is None
+
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE query_embeddings SET created_at = created_at - 3600")
+    monkeypatch.setattr(embedding_cache, "DISK_PRUNE_SECONDS", 0.0)
+    cache.put_many([b"fresh"], rows(1))
+    assert disk_count(path) == 1
+    cache.close()
+
+
+@pytest.mark.parametrize("max_entries", [0, 100])
+def test_disk_cap_only_applies_when_set(tmp_path, max_entries, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "DISK_PRUNE_EVERY_ROWS", 1)
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(max_bytes=0, ttl_seconds=60, disk_path=path, disk_max_entries=max_entries)
+    cache.put_many([bytes([i]) for i in range(20)], rows(20))
+    assert disk_count(path) == 20
+    cache.close()
@@ -0,0 +1,65 @@
+"""html_text_prefix must agree with the canonical converter when a probe cuts through markup.
+
+Needs the pipeline repo for remove_html_markup; skipped without it.
+"""
+import pytest
+
+try:
+    from utils.html_truncate import MIN_PROBE_CHARS, html_text_prefix
+    from utils.html_utils import remove_html_markup
+except ImportError as exc:
+    pytest.skip(f"canonical remove_html_markup unavailable: {exc}", allow_module_level=True)
+
+
+LIMIT = 50
+CONSTRUCTS = {
+    "entity": "&#8212;&nbsp;&amp;",
+    "double_escaped_entity": "&amp;lt;b&amp;gt;bold&amp;lt;/b&amp;gt;",
+    "tag": '<a href="https://example.com/jobs/12345?utm_source=board" target="_blank">',
+    "closing_tag": "</strong></em></p>",
+    "comment": "<!-- <p>hidden &amp; text</p> -->",
+    "script": "<script>var s = '<p>not text</p>';</script>",
+    "style": "<style>p > b { color: red }</style>",
+}
+
+
+def cut_document(construct: str, boundary: int, offset: int) -> str:
+    """HTML whose first LIMIT visible characters end just past ``construct``, which spans ``boundary``."""
+    head = "<p>" + "x" * (LIMIT - 5)
+    # A comment pads to the boundary without adding text, so the text near LIMIT sits at the cut.
+    pad = "<!--" + "." * (boundary - offset - len(head) - 7) + "-->"
+    tail = " tail text goes on</p>" + "<p>more text</p>" * (boundary // 4)
+    return head + pad + construct + tail
+
+
+@pytest.mark.parametrize("name", sorted(CONSTRUCTS))
+@pytest.mark.parametrize("boundary", [MIN_PROBE_CHARS, 2 * MIN_PROBE_CHARS])
+def test_prefix_matches_canonical_when_cut_inside_markup(name, boundary):
+    construct = CONSTRUCTS[name]
+    for offset in range(1, len(construct)):
+        html = cut_document(construct, boundary, offset)
+        expected = remove_html_markup(html, double_unescape=True)[:LIMIT]
+        assert html_text_prefix(html, LIMIT, double_unescape=True) == expected, (name, offset)
+
+
+def test_short_and_empty_inputs():
+    assert html_text_prefix("", LIMIT) == ""
+    assert html_text_prefix("<p>short</p>", 0) == ""
+    html = "<p>short &amp; sweet</p>"
+    assert html_text_prefix(html, LIMIT, True) == remove_html_markup(html, double_unescape=True)[:LIMIT]
+
+
+@pytest.mark.parametrize("chars", [5_000, 13_000, 20_000, 30_000, 36_000, 50_000, 400_000])
+def test_never_converts_more_than_the_whole_document_when_prefixes_agree(chars, monkeypatch):
+    import utils.html_truncate as html_truncate
+
+    converted = []
+
+    def counting(html, double_unescape=False):
+        converted.append(len(html))
+        return remove_html_markup(html, double_unescape=double_unescape)
+
+    monkeypatch.setattr(html_truncate, "remove_html_markup", counting)
+    html = ("<p>word &amp; more</p>" * (chars // 22 + 1))[:chars]
+    assert html_text_prefix(html, 3000, True) == remove_html_markup(html, double_unescape=True)[:3000]
+    assert sum(converted) <= chars
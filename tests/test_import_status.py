@@ -0,0 +1,104 @@
+"""Duration parsing and throughput estimates in ops/import_status.py."""
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from import_status import estimate_throughput, fetch_batch_timings, leaf_steps, parse_duration
+
+
+@pytest.mark.parametrize(
+    ("raw", "seconds"),
+    [
+        ("PT1.5S", 1.5),
+        ("PT2M3S", 123.0),
+        ("PT1H", 3600.0),
+        ("P1D", 86400.0),
+        ("P2DT3H4M5.5S", 2 * 86400 + 3 * 3600 + 4 * 60 + 5.5),
+        ("12.5ms", 0.0125),
+        ("250µs", 0.00025),
+        ("3s", 3.0),
+        ("2m", 120.0),
+    ],
+)
+def test_parse_duration(raw, seconds):
+    assert parse_duration(raw) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("raw", [None, "", "P", "PT", "P1H", "soon"])
+def test_parse_duration_rejects_non_durations(raw):
+    assert parse_duration(raw) is None
+
+
+START = datetime(2026, 1, 1, tzinfo=UTC)
+
+
+def task(finished_after: float, docs: int, queued: float = 1.0, processing: float = 2.0, status: str = "succeeded"):
+    finished = START + timedelta(seconds=finished_after)
+    started = finished - timedelta(seconds=processing)
+    enqueued = started - timedelta(seconds=queued)
+    return {
+        "status": status,
+        "enqueuedAt": enqueued.isoformat().replace("+00:00", "Z"),
+        "startedAt": started.isoformat(),
+        "finishedAt": finished.isoformat(),
+        "details": {"receivedDocuments": docs, "indexedDocuments": docs},
+    }
+
+
+def test_estimate_throughput_measures_between_completions():
+    tasks = [task(0, 500), task(10, 100), task(20, 100), task(20, 100), task(40, 100), task(50, 10, status="failed")]
+
+    result = estimate_throughput(tasks, pending_load=3600)
+
+    # The first completion's documents predate the window: 400 documents over 40 seconds.
+    assert result["docs_per_second"] == pytest.approx(10.0)
+    assert result["seconds_remaining"] == pytest.approx(360.0)
+    assert result["hours_remaining"] == pytest.approx(0.1)
+    assert result["recent_batches"] == 5
+    assert result["window_start"] == START.isoformat()
+    assert result["window_end"] == (START + timedelta(seconds=40)).isoformat()
+    assert result["queue_wait_seconds"]["p50"] == pytest.approx(1.0)
+    assert result["processing_seconds"]["max"] == pytest.approx(2.0)
+    # Per-slice rates are 10, 20 and 5 docs/s; fast slices give the low ETA.
+    assert result["hours_remaining_low"] < result["hours_remaining"] < result["hours_remaining_high"]
+
+
+def test_estimate_throughput_without_enough_tasks():
+    result = estimate_throughput([task(0, 100)], pending_load=1000)
+    assert result["docs_per_second"] is None
+    assert result["seconds_remaining"] is None
+    assert result["hours_remaining_low"] is None
+    assert result["batch_timings"] == {}
+
+
+TRACE = {
+    "processing tasks": "10s",
+    "processing tasks > indexing": "9s",
+    "processing tasks > indexing > extracting embeddings": "6s",
+    "processing tasks > indexing > extracting embeddings > requesting": "5s",
+    "processing tasks > indexing > extracting embeddings > writing": "1s",
+    "processing tasks > indexing > word docids": "2s",
+}
+
+
+def test_leaf_steps_skips_parents():
+    assert list(leaf_steps(TRACE)) == [
+        "processing tasks > indexing > extracting embeddings > requesting",
+        "processing tasks > indexing > extracting embeddings > writing",
+        "processing tasks > indexing > word docids",
+    ]
+
+
+def test_fetch_batch_timings_counts_embedding_leaves_once(monkeypatch):
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"duration": "PT10S", "stats": {"progressTrace": TRACE}}
+
+    monkeypatch.setattr("import_status.requests.get", lambda *args, **kwargs: Response())
+
+    result = fetch_batch_timings("http://meili", [{"batchUid": 1}, {"batchUid": 1}, {"batchUid": 2}], limit=5)
+
+    assert result == {"batches": 2, "embedding_seconds": 12.0, "indexing_seconds": 8.0, "embedding_share": 0.6}
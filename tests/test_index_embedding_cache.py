@@ -0,0 +1,59 @@
+"""Buffered bookkeeping in ops/index_embedding_cache.py."""
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+import index_embedding_cache
+from index_embedding_cache import IndexEmbeddingStore, prewarm_refusal
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IndexEmbeddingStore(tmp_path / "index.sqlite", "model", 4)
+    yield store
+    store.close()
+
+
+def last_used(store, key):
+    with sqlite3.connect(store.path) as db:
+        return db.execute("SELECT last_used_at FROM index_embeddings WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_lookups_buffer_touches_until_flush(store, monkeypatch):
+    store.put_many([b"a", b"b"], np.eye(2, 4, dtype=np.float32))
+    stored_at = last_used(store, b"a")
+    time.sleep(0.01)
+
+    found = store.get_many([b"a", b"missing", b"a"])
+
+    assert [row is not None for row in found] == [True, False, True]
+    np.testing.assert_array_equal(found[0], [1, 0, 0, 0])
+    assert last_used(store, b"a") == stored_at
+    assert (store.hits, store.misses) == (2, 1)
+
+    monkeypatch.setattr(index_embedding_cache, "TOUCH_FLUSH_KEYS", 1)
+    store.get_many([b"a"])
+    assert last_used(store, b"a") > stored_at
+    assert last_used(store, b"b") == stored_at
+
+
+def test_compact_and_summary_see_buffered_lookups(store):
+    store.put_many([b"old", b"hot"], np.ones((2, 4), dtype=np.float32))
+    with sqlite3.connect(store.path) as db:
+        db.execute("UPDATE index_embeddings SET last_used_at = ?", (time.time() - 40 * 86400,))
+    store.get_many([b"hot", b"cold"])
+
+    assert store.compact(max_idle_days=30) == 1
+    assert store.get_many([b"hot", b"old"])[1] is None
+    summary = store.summary(days=1)
+    assert (summary["hits"], summary["misses"]) == (2, 2)
+
+
+def test_prewarm_refuses_quantized_stored_vectors():
+    refusal = prewarm_refusal
+    assert refusal({"source": "composite"}, "none") is None
+    assert refusal(None, "none") is None
+    assert "PPLX_QUANTIZE=int8" in refusal({"source": "composite"}, "int8")
+    assert "binaryQuantized" in refusal({"source": "composite", "binaryQuantized": True}, "none")
@@ -0,0 +1,109 @@
+"""Settings diffing in ops/meili_settings.py. No Meilisearch needed."""
+import json
+
+from ops import meili_settings
+from ops.meili_settings import MeiliSettings, diff_settings
+
+
+REST_EMBEDDER = {
+    "source": "rest",
+    "url": "http://127.0.0.1:8090/embed",
+    "dimensions": 512,
+    "request": {"inputs": ["{{text}}"]},
+    "response": {"embeddings": [{"values": "{{embedding}}"}]},
+}
+
+
+def test_embedder_matches_when_server_adds_defaults_and_masks_keys():
+    current = {
+        "embedders": {
+            "default": {
+                **REST_EMBEDDER,
+                "apiKey": "sk-a...",
+                "documentTemplateMaxBytes": 400,
+                "headers": {},
+                "distribution": None,
+            }
+        }
+    }
+    assert diff_settings(current, {"embedders": {"default": REST_EMBEDDER}}) == {}
+
+
+def test_changed_embedder_is_sent_in_full():
+    current = {"embedders": {"default": REST_EMBEDDER}}
+    desired = {"embedders": {"default": {**REST_EMBEDDER, "dimensions": 256}}}
+    assert diff_settings(current, desired) == desired
+
+
+def test_embedders_missing_from_spec_are_removed():
+    current = {"embedders": {"default": REST_EMBEDDER, "old": {"source": "userProvided", "dimensions": 4}}}
+    assert diff_settings(current, {"embedders": {"default": REST_EMBEDDER}}) == {"embedders": {"old": None}}
+
+
+def test_orderless_settings_ignore_order_but_ranked_ones_do_not():
+    current = {
+        "filterableAttributes": ["industry", "ats_type", "job_type"],
+        "searchableAttributes": ["title", "company", "description"],
+    }
+    desired = {
+        "filterableAttributes": ["job_type", "industry", "ats_type"],
+        "searchableAttributes": ["company", "title", "description"],
+    }
+    assert diff_settings(current, desired) == {"searchableAttributes": desired["searchableAttributes"]}
+
+
+def test_unmanaged_keys_are_left_alone_and_synonyms_are_replaced():
+    current = {"rankingRules": ["words", "typo"], "synonyms": {"js": ["javascript"], "pm": ["product manager"]}}
+    desired = {"synonyms": {"js": ["javascript"]}}
+    assert diff_settings(current, desired) == desired
+
+
+class FakeMeili:
+    """Just enough of the settings and tasks endpoints for MeiliSettings.apply."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.patches = []
+
+    def get(self, url, headers=None, timeout=None):
+        if url.endswith("/settings"):
+            return FakeResponse(200, json.loads(json.dumps(self.settings)))
+        return FakeResponse(200, {"status": "succeeded"})
+
+    def patch(self, url, headers=None, data=None, timeout=None):
+        self.patches.append(json.loads(data))
+        return FakeResponse(202, {"taskUid": len(self.patches)})
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+def test_apply_resets_embedder_whose_source_changed_first(monkeypatch):
+    fake = FakeMeili({"embedders": {"default": {"source": "userProvided", "dimensions": 512}}})
+    monkeypatch.setattr(meili_settings, "requests", fake)
+
+    changes = MeiliSettings("http://meili", "jobs").apply({"embedders": {"default": REST_EMBEDDER}})
+
+    assert changes == {"embedders": {"default": REST_EMBEDDER}}
+    assert fake.patches == [{"embedders": {"default": None}}, changes]
+
+
+def test_apply_sends_nothing_when_up_to_date_or_dry_run(monkeypatch):
+    fake = FakeMeili({"embedders": {"default": REST_EMBEDDER}, "sortableAttributes": ["salary_max"]})
+    monkeypatch.setattr(meili_settings, "requests", fake)
+    settings = MeiliSettings("http://meili", "jobs")
+
+    assert settings.apply({"embedders": {"default": REST_EMBEDDER}}) == {}
+    assert settings.apply({"sortableAttributes": ["salary_min"]}, dry_run=True) == {"sortableAttributes": ["salary_min"]}
+    assert fake.patches == []
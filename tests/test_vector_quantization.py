@@ -0,0 +1,67 @@
+"""Quantization and recall helpers in ops/vector_quantization.py."""
+import numpy as np
+import pytest
+
+from ops.vector_quantization import l2_normalize, quantize, recall_at_k, top_k, truncate_dims
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return l2_normalize(rng.standard_normal((200, 64)).astype(np.float32))
+
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_quantize_returns_unit_float32_vectors(vectors, mode):
+    snapped = quantize(vectors, mode)
+    assert snapped.dtype == np.float32
+    assert snapped.shape == vectors.shape
+    np.testing.assert_allclose(np.linalg.norm(snapped, axis=1), 1.0, rtol=1e-5)
+
+
+def test_int8_keeps_255_levels_and_stays_close(vectors):
+    raw = quantize(vectors, "int8", normalize=False)
+    levels = raw * 127.0
+    np.testing.assert_allclose(levels, np.rint(levels), atol=1e-4)
+    assert np.abs(raw).max() <= 1.0
+    assert np.abs(raw - vectors).max() <= 0.5 / 127.0 + 1e-6
+
+
+def test_binary_keeps_only_signs(vectors):
+    raw = quantize(vectors, "binary", normalize=False)
+    assert set(np.unique(raw).tolist()) <= {-1.0, 1.0}
+    assert np.array_equal(raw > 0, vectors >= 0)
+
+
+def test_none_and_unknown_modes(vectors):
+    assert quantize(vectors, "none") is vectors
+    with pytest.raises(ValueError):
+        quantize(vectors, "int4")
+
+
+def test_truncate_dims_renormalizes(vectors):
+    short = truncate_dims(vectors, 16)
+    assert short.shape == (200, 16)
+    np.testing.assert_allclose(np.linalg.norm(short, axis=1), 1.0, rtol=1e-5)
+    assert truncate_dims(vectors, 0) is vectors
+    assert truncate_dims(vectors, 64) is vectors
+
+
+def test_top_k_is_exact_and_ordered(vectors):
+    queries = vectors[:10]
+    result = top_k(queries, vectors, k=5, chunk_size=3)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :5]
+    assert np.array_equal(result, expected)
+    # Each query is its own nearest neighbour.
+    assert np.array_equal(result[:, 0], np.arange(10))
+
+
+def test_recall_at_k(vectors):
+    reference = top_k(vectors[:20], vectors, k=10)
+    assert recall_at_k(reference, reference) == 1.0
+    assert recall_at_k(reference, reference[:, ::-1]) == 1.0
+    assert recall_at_k(reference[:, :2], np.array([[reference[i, 0], -1] for i in range(20)])) == 0.5
+    assert recall_at_k(np.empty((0, 10), dtype=np.int64), np.empty((0, 10), dtype=np.int64)) == 0.0
+    # int8 keeps nearly all neighbours; binary keeps fewer but far more than chance.
+    assert recall_at_k(reference, top_k(vectors[:20], quantize(vectors, "int8"), k=10)) >= 0.9
+    assert recall_at_k(reference, top_k(vectors[:20], quantize(vectors, "binary"), k=10)) > 0.2
@@ -1,5 +1,6 @@
 from .func_utils import slice, squish
 from .html_utils import remove_html_markup
+from .html_truncate import html_text_prefix
 from .job_utils import get_company_name
 
-__all__ = ['remove_html_markup', 'get_company_name', 'slice', 'squish']
+__all__ = ['remove_html_markup', 'html_text_prefix', 'get_company_name', 'slice', 'squish']
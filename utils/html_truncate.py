@@ -0,0 +1,49 @@
+"""Visible-text prefixes of large HTML documents without converting all of them.
+
+Document building keeps only the first few thousand characters of a posting's
+text, but some postings carry hundreds of KB of HTML. ``html_text_prefix`` runs
+the canonical ``remove_html_markup`` over growing prefixes of the HTML and stops
+once two consecutive prefixes agree on the first ``limit`` characters. That is a
+heuristic, not a proof: it matches ``remove_html_markup(html)[:limit]`` on the
+postings we benchmark (``benchmark_html_truncation.py`` counts mismatches), but
+markup whose effect reaches back across a long stretch of HTML could defeat it.
+Loaders therefore keep the exact conversion unless asked otherwise.
+"""
+
+from .html_utils import remove_html_markup
+
+
+# Smallest HTML prefix worth probing.
+MIN_PROBE_CHARS = 4096
+# Escaped Greenhouse HTML runs several characters of markup per visible one.
+PROBE_CHARS_PER_TEXT_CHAR = 4
+
+
+def html_text_prefix(html: str, limit: int, double_unescape: bool = False) -> str:
+    """Approximate ``remove_html_markup(html, double_unescape)[:limit]``, converting as little HTML as needed.
+
+    A cut through the HTML normally only disturbs text near the cut (a half-open
+    tag, entity, comment or script), so once the text of a prefix and of one twice
+    as long agree on their first ``limit`` characters we take that as the text of
+    the full document.
+
+    A prefix is only converted while everything converted so far plus that prefix
+    is still less than the whole document. Documents shorter than the first two
+    probes together are converted in one go, so probing never costs more than the
+    full conversion unless no pair of prefixes agrees.
+    """
+    if not html or limit <= 0:
+        return ""
+    probe = max(MIN_PROBE_CHARS, limit * PROBE_CHARS_PER_TEXT_CHAR)
+    if 3 * probe >= len(html):
+        return remove_html_markup(html, double_unescape=double_unescape)[:limit]
+    converted = 0
+    previous = None
+    while converted + probe < len(html):
+        text = remove_html_markup(html[:probe], double_unescape=double_unescape)[:limit]
+        if len(text) == limit and text == previous:
+            return text
+        previous = text if len(text) == limit else None
+        converted += probe
+        probe *= 2
+    return remove_html_markup(html, double_unescape=double_unescape)[:limit]
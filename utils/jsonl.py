@@ -0,0 +1,156 @@
+"""JSONL reading and writing shared by the loader and evaluation scripts.
+
+Compressed inputs are recognised by their magic bytes (bz2, gzip, zstd), so
+``data/raw/greenhouse.jsonl.bz2`` and a plain ``.jsonl`` read the same way.
+Encoding and decoding use orjson (a declared dependency) and fall back to the
+stdlib ``json`` module where it is missing. The two differ on non-finite floats:
+orjson writes ``NaN`` and ``Infinity`` as ``null``, ``json`` writes the bare
+tokens, so ``loads(dumps(x))`` only preserves them without orjson.
+"""
+
+import bz2
+import gzip
+import io
+import json
+import mmap
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+READ_BUFFER_BYTES = 1 << 20
+BZ2_MAGIC = b"BZh"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def loads(data: bytes | str) -> Any:
+    """Decode one JSON document.
+
+    orjson rejects the ``NaN``/``Infinity`` tokens Python's ``json`` writes, so
+    those documents are retried with the stdlib decoder.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps(obj: Any) -> bytes:
+    """One compact UTF-8 JSON document, without the trailing newline.
+
+    Non-string keys are written as strings, as ``json.dumps`` does. Values orjson
+    can't represent, such as integers wider than 64 bits, fall back to the stdlib
+    encoder. With orjson, ``NaN`` and infinities become ``null``.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError.
+            return _stdlib_dumps(obj)
+    return _stdlib_dumps(obj)
+
+
+def compression(path: str | Path) -> str | None:
+    """``"bz2"``, ``"gzip"``, ``"zstd"`` or None, judged from the file's first bytes."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(BZ2_MAGIC):
+        return "bz2"
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise RuntimeError("reading or writing zstd JSONL needs the zstandard package") from exc
+    return zstandard
+
+
+def open_binary(path: str | Path) -> BinaryIO:
+    """Open ``path`` for buffered binary reading, decompressing if needed."""
+    kind = compression(path)
+    if kind == "bz2":
+        return io.BufferedReader(bz2.BZ2File(path, "rb"), buffer_size=READ_BUFFER_BYTES)
+    if kind == "gzip":
+        return io.BufferedReader(gzip.GzipFile(path, "rb"), buffer_size=READ_BUFFER_BYTES)
+    if kind == "zstd":
+        raw = open(path, "rb")
+        reader = _zstd().ZstdDecompressor().stream_reader(raw, read_size=READ_BUFFER_BYTES, closefd=True)
+        return io.BufferedReader(reader, buffer_size=READ_BUFFER_BYTES)
+    return open(path, "rb", buffering=READ_BUFFER_BYTES)
+
+
+def _iter_mmap_lines(path: str | Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        if not f.seek(0, io.SEEK_END):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end < 0:
+                    end = size
+                yield mm[start:end]
+                start = end + 1
+
+
+def _iter_stream_lines(path: str | Path) -> Iterator[bytes]:
+    with open_binary(path) as f:
+        yield from f
+
+
+def iter_lines(path: str | Path, use_mmap: bool = False) -> Iterator[bytes]:
+    """Non-blank lines of a JSONL file as undecoded bytes, without line endings.
+
+    ``use_mmap`` memory-maps uncompressed files instead of reading them through a
+    buffer; compressed files are always streamed.
+    """
+    if use_mmap and compression(path) is None:
+        lines = _iter_mmap_lines(path)
+    else:
+        lines = _iter_stream_lines(path)
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def iter_jsonl(path: str | Path, use_mmap: bool = False) -> Iterator[Any]:
+    """Decoded records of a JSONL file, skipping blank lines."""
+    for line in iter_lines(path, use_mmap=use_mmap):
+        yield loads(line)
+
+
+def write_jsonl(path: str | Path, rows: Iterable[Any]) -> None:
+    """Write ``rows`` one per line, compressed according to the suffix (.bz2, .gz, .zst)."""
+    suffix = Path(path).suffix
+    if suffix == ".bz2":
+        f = bz2.open(path, "wb")
+    elif suffix == ".gz":
+        f = gzip.open(path, "wb")
+    elif suffix == ".zst":
+        f = _zstd().open(path, "wb")
+    else:
+        f = open(path, "wb", buffering=READ_BUFFER_BYTES)
+    with f:
+        for row in rows:
+            f.write(dumps(row))
+            f.write(b"\n")